@@ -0,0 +1,156 @@
+import json
+import math
+import multiprocessing as mp
+import os
+import numpy as np
+import torch
+
+from mcts import make_mcts
+from model import make_model
+
+# --- Arena ---
+# Plays games between two players and counts the results. A player is an
+# object with reset() (called before every game) and __call__(canonical
+# board) -> action. Games come in pairs that share a random opening, with
+# colours swapped between the two games of a pair, so neither player gets
+# the first move more often and deterministic players do not replay one game.
+
+class MCTSPlayer:
+    # Greedy (temp=0) MCTS over `nnet`, with a fresh tree every game
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.mcts = None
+
+    def reset(self):
+        self.mcts = make_mcts(self.game, self.nnet, self.args)
+
+    def __call__(self, canonical_board):
+        return int(np.argmax(self.mcts.getActionProb(canonical_board, temp=0)))
+
+def mcts_player(game, nnet, args):
+    return MCTSPlayer(game, nnet, args)
+
+class Arena:
+    def __init__(self, player1, player2, game, opening_moves=2, seed=0):
+        self.player1 = player1
+        self.player2 = player2
+        self.game = game
+        self.opening_moves = opening_moves
+        self.seed = seed
+
+    def opening(self, pair):
+        # Random stones (alternating colours, black first) shared by both games of a pair
+        rng = np.random.default_rng([self.seed, pair])
+        board, player = self.game.get_init_board(), 1
+        for _ in range(self.opening_moves):
+            a = int(rng.choice(np.flatnonzero(board.reshape(-1) == 0)))
+            board, player = self.game.get_next_state(board, player, a)
+        return board, player
+
+    def play_game(self, first, board, cur_player):
+        # Plays on from (board, cur_player); `first` (player1 or player2)
+        # moves now. Returns 1 if player1 won, -1 if player2 won, 0 for a draw.
+        players = {cur_player: first, -cur_player: self.player2 if first is self.player1 else self.player1}
+        for p in players.values():
+            p.reset()
+        empty_count = self.game.count_empty(board)
+
+        while True:
+            action = players[cur_player](self.game.get_canonical_form(board, cur_player))
+            mover = players[cur_player]
+            board, cur_player, r = self.game.get_next_state_with_result(board, cur_player, action, empty_count)
+            empty_count -= 1
+            if r == -1:
+                return 1 if mover is self.player1 else -1
+            if r != 0:
+                return 0
+
+    def play_indexed(self, i):
+        # Game i of a match: opening i // 2, player1 moves first in even games
+        board, cur_player = self.opening(i // 2)
+        first = self.player1 if i % 2 == 0 else self.player2
+        return self.play_game(first, board, cur_player)
+
+    def play_games(self, num):
+        # Returns (player1 wins, player2 wins, draws) over num games
+        return tally(self.play_indexed(i) for i in range(num))
+
+def tally(results):
+    results = list(results)
+    return results.count(1), results.count(-1), results.count(0)
+
+# --- Parallel matches ---
+# Like parallel self-play: each worker process builds both networks from
+# their state dicts once and plays whole games; game i is the same game no
+# matter which worker plays it, so a match is reproducible.
+
+_worker = {}
+
+def _init_worker(game, state_dicts, args):
+    torch.set_num_threads(1)
+    players = []
+    for state_dict in state_dicts:
+        nnet = make_model(game, args)
+        nnet.load_state_dict(state_dict)
+        nnet.eval()
+        players.append(MCTSPlayer(game, nnet, args))
+    _worker['arena'] = Arena(*players, game, seed=getattr(args, 'seed', None) or 0)
+
+def _play_game(i):
+    return _worker['arena'].play_indexed(i)
+
+def play_match(game, nnet1, nnet2, args, num_games):
+    # (nnet1 wins, nnet2 wins, draws) over num_games MCTS games, played by
+    # args.num_workers processes (in this process if there is only one)
+    if args.num_workers <= 1:
+        arena = Arena(MCTSPlayer(game, nnet1, args), MCTSPlayer(game, nnet2, args), game,
+                      seed=getattr(args, 'seed', None) or 0)
+        return arena.play_games(num_games)
+
+    state_dicts = [{k: v.detach().cpu() for k, v in nnet.state_dict().items()} for nnet in (nnet1, nnet2)]
+    ctx = mp.get_context(getattr(args, 'mp_start_method', None))
+    with ctx.Pool(args.num_workers, initializer=_init_worker, initargs=(game, state_dicts, args)) as pool:
+        return tally(pool.imap_unordered(_play_game, range(num_games)))
+
+# --- Elo ---
+
+def elo_difference(wins, losses, draws):
+    # Rating difference implied by a match score; the score is kept inside
+    # (0, 1) by half a game so a clean sweep gives a finite number
+    games = wins + losses + draws
+    score = (wins + 0.5 * draws) / games
+    score = min(max(score, 0.5 / games), 1 - 0.5 / games)
+    return 400 * math.log10(score / (1 - score))
+
+class EloLog:
+    # Elo of every checkpoint that played an arena match, stored in a JSON
+    # file: a candidate's rating is the rating of the best net it played
+    # plus the difference implied by its score
+    def __init__(self, path):
+        self.path = path
+        self.data = {'best': None, 'ratings': {}, 'matches': []}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                print(f"Error loading Elo log: {e}. Starting fresh Elo log.")
+
+    def rating(self, name):
+        return self.data['ratings'].get(name, 0.0)
+
+    def record(self, candidate, best, wins, losses, draws, promoted, iteration):
+        elo = self.rating(best) + elo_difference(wins, losses, draws) if best else 0.0
+        self.data['ratings'][candidate] = elo
+        self.data['matches'].append({'iteration': iteration, 'candidate': candidate, 'best': best,
+                                     'wins': wins, 'losses': losses, 'draws': draws,
+                                     'elo': elo, 'promoted': promoted})
+        if promoted:
+            self.data['best'] = candidate
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(tmp, self.path)
+        return elo
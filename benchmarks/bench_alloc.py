@@ -0,0 +1,64 @@
+# Board representation cost inside the search: time per simulation and the
+# memory allocated while one simulation runs (tracemalloc peak, averaged).
+#
+#   python -m benchmarks.bench_alloc --sizes 8 15
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from game import GomokuGame
+from mcts import make_mcts
+from model import GomokuNet
+from benchmarks.bench_mcts import Args, opening_position
+
+
+def per_sim(game, nnet, backend, sims):
+    args = Args()
+    args.mcts_backend = backend
+    args.numMCTSSims = sims
+    mcts = make_mcts(game, nnet, args)
+    board = opening_position(game)
+
+    # Time: one call with the whole budget
+    start = time.perf_counter()
+    mcts.getActionProb(board)
+    seconds = (time.perf_counter() - start) / sims
+
+    # Memory: grow a fresh tree one simulation at a time, measuring each
+    mcts = make_mcts(game, nnet, args)
+    mcts.getActionProb(board, max_sims=1)  # sets up and expands the root
+    peaks = []
+    tracemalloc.start()
+    for _ in range(sims):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        mcts.search(board)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return seconds, np.mean(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--sims', type=int, default=200)
+    parser.add_argument('--backends', nargs='+', default=['dict', 'array'])
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"{'board':>6} {'backend':>8} {'dtype':>6} {'us/sim':>8} {'KB alloc/sim':>13}")
+    for n in opts.sizes:
+        game = GomokuGame(n=n)
+        nnet = GomokuNet(game)
+        nnet.eval()
+        for backend in opts.backends:
+            seconds, peak = per_sim(game, nnet, backend, opts.sims)
+            dtype = game.get_init_board().dtype
+            print(f"{n:>4}x{n:<2} {backend:>7} {str(dtype):>6} {seconds * 1e6:>8.0f} {peak / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Terminal-check cost per board size: the full-board get_game_ended scan
+# versus the last-move get_move_result check.
+#
+#   python -m benchmarks.bench_game --sizes 8 15
+import argparse
+import time
+
+import numpy as np
+
+from game import GomokuGame
+
+
+def random_positions(game, count, fill, seed=0):
+    # (board, player, action, empty_count) right after `player` played `action`
+    rng = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < count:
+        board = game.get_init_board()
+        player = 1
+        for _ in range(int(fill * game.n * game.n)):
+            empty = np.flatnonzero(board.reshape(-1) == 0)
+            action = int(rng.choice(empty))
+            board, player = game.get_next_state(board, player, action)
+            if game.get_game_ended(board, player) != 0:
+                break
+        else:
+            positions.append((board, -player, action, game.count_empty(board)))
+    return positions
+
+
+def time_per_call(fn, positions, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in positions:
+            fn(*args)
+    return (time.perf_counter() - start) / (repeat * len(positions))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--positions', type=int, default=50)
+    parser.add_argument('--fill', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=20)
+    opts = parser.parse_args()
+
+    print(f"{'board':>6} {'full scan (us)':>15} {'last move (us)':>15} {'speedup':>8}")
+    for n in opts.sizes:
+        game = GomokuGame(n=n)
+        positions = random_positions(game, opts.positions, opts.fill)
+
+        full = time_per_call(lambda b, p, a, e: game.get_game_ended(b, -p), positions, opts.repeat)
+        incremental = time_per_call(game.get_move_result, positions, opts.repeat)
+        print(f"{n:>4}x{n:<2} {full * 1e6:>15.1f} {incremental * 1e6:>15.1f} {full / incremental:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
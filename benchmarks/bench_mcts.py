@@ -0,0 +1,76 @@
+# Simulations per second of the MCTS backends.
+#
+#   python -m benchmarks.bench_mcts --sizes 8 15 --sims 200 --radii 0 2
+#
+# Uses a randomly initialised GomokuNet so no checkpoint is needed; the
+# network weights do not change the amount of tree work per simulation.
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from game import GomokuGame
+from model import GomokuNet
+from mcts import make_mcts
+
+
+class Args:
+    numMCTSSims = 200
+    cpuct = 1.0
+    device = 'cpu'
+    mcts_backend = 'array'
+    mcts_batch_size = 1
+
+
+def opening_position(game):
+    # A few stones around the centre so the search is not on an empty board
+    board = game.get_init_board()
+    c = game.n // 2
+    for (r, col), player in zip([(c, c), (c, c + 1), (c + 1, c), (c - 1, c - 1)], [1, -1, 1, -1]):
+        board[r][col] = player
+    return board
+
+
+def bench(game, nnet, backend, sims, batch_size=1, radius=0):
+    args = Args()
+    args.numMCTSSims = sims
+    args.mcts_backend = backend
+    args.mcts_batch_size = batch_size
+    args.move_radius = radius
+    mcts = make_mcts(game, nnet, args)
+    board = opening_position(game)
+
+    np.random.seed(0)
+    start = time.perf_counter()
+    mcts.getActionProb(board, temp=1)
+    elapsed = time.perf_counter() - start
+    return sims / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--sims', type=int, default=200)
+    parser.add_argument('--backends', nargs='+', default=['dict', 'array'])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1],
+                        help="mcts_batch_size values to try (array backend only)")
+    parser.add_argument('--radii', type=int, nargs='+', default=[0],
+                        help="move_radius values to try (0 = every empty cell)")
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"{'board':>6} {'backend':>8} {'K':>3} {'radius':>6} {'sims':>6} {'sims/sec':>10}")
+    for n in opts.sizes:
+        game = GomokuGame(n=n)
+        nnet = GomokuNet(game)
+        nnet.eval()
+        for backend in opts.backends:
+            for k in (opts.batch_sizes if backend == 'array' else [1]):
+                for radius in opts.radii:
+                    rate = bench(game, nnet, backend, opts.sims, k, radius)
+                    print(f"{n:>4}x{n:<2} {backend:>7} {k:>3} {radius:>6} {opts.sims:>6} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Network cost: parameters, FLOPs per position and forward latency per batch
+# of GomokuNet ('conv') against ResGomokuNet ('resnet') configurations.
+#
+#   python -m benchmarks.bench_model --sizes 8 15 --batch-sizes 1 8 64
+#
+# FLOPs count multiply-adds of conv and linear layers as 2 operations
+# (BatchNorm, activations and pooling are left out).
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from game import GomokuGame
+from model import GomokuNet, ResGomokuNet
+
+
+def flops_per_position(nnet, n):
+    total = []
+
+    def hook(module, inputs, output):
+        if isinstance(module, nn.Conv2d):
+            k = module.kernel_size[0] * module.kernel_size[1] * module.in_channels // module.groups
+            total.append(2 * k * output[0].numel())
+        elif isinstance(module, nn.Linear):
+            total.append(2 * module.in_features * module.out_features)
+
+    handles = [m.register_forward_hook(hook) for m in nnet.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    nnet.predict(np.zeros((1, n, n), dtype=np.int8))
+    for h in handles:
+        h.remove()
+    return sum(total)
+
+
+def latency_ms(nnet, n, batch_size, repeat):
+    boards = np.random.default_rng(0).integers(-1, 2, size=(batch_size, n, n)).astype(np.int8)
+    nnet.predict(boards) # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        nnet.predict(boards)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def models(game, blocks, channels):
+    yield 'conv', GomokuNet(game)
+    for b in blocks:
+        for c in channels:
+            yield f'resnet {b}x{c}', ResGomokuNet(num_channels=c, num_blocks=b)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--blocks', type=int, nargs='+', default=[6, 10])
+    parser.add_argument('--channels', type=int, nargs='+', default=[64])
+    parser.add_argument('--repeat', type=int, default=20)
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    batch_cols = ' '.join(f"{f'ms@{b}':>9}" for b in opts.batch_sizes)
+    print(f"{'board':>6} {'model':>14} {'params':>10} {'MFLOPs':>8} {batch_cols}")
+    for n in opts.sizes:
+        game = GomokuGame(n=n)
+        for name, nnet in models(game, opts.blocks, opts.channels):
+            nnet.eval()
+            params = sum(p.numel() for p in nnet.parameters())
+            flops = flops_per_position(nnet, n)
+            times = ' '.join(f"{latency_ms(nnet, n, b, opts.repeat):>9.2f}" for b in opts.batch_sizes)
+            print(f"{n:>4}x{n:<2} {name:>14} {params:>10} {flops / 1e6:>8.1f} {times}")
+
+
+if __name__ == "__main__":
+    main()
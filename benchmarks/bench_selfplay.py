@@ -0,0 +1,59 @@
+# Self-play episodes and training examples per hour against the number of
+# worker processes, optionally with playout-cap randomization and Gumbel
+# root search (see selfplay.execute_episode).
+#
+#   python -m benchmarks.bench_selfplay --workers 1 2 4 --episodes 8
+#   python -m benchmarks.bench_selfplay --workers 1 --playout-cap 0.25 --fast-sims 10 --gumbel
+#
+# Scaling is only meaningful with at least as many CPU cores as workers.
+import argparse
+import os
+import time
+
+import torch
+
+from game import GomokuGame
+from model import GomokuNet
+from selfplay import parallel_self_play
+from train import Args
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--episodes', type=int, default=8)
+    parser.add_argument('--sims', type=int, default=50)
+    parser.add_argument('--playout-cap', type=float, default=1.0, help="share of moves with a full, recorded search")
+    parser.add_argument('--fast-sims', type=int, default=20, help="simulations of the other moves")
+    parser.add_argument('--gumbel', action='store_true', help="Gumbel root search with sequential halving")
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    game = GomokuGame(n=opts.size)
+    nnet = GomokuNet(game)
+
+    args = Args()
+    args.numMCTSSims = opts.sims
+    args.seed = 0
+    args.playout_cap_fraction = opts.playout_cap
+    args.fast_sims = opts.fast_sims
+    args.gumbel_root = opts.gumbel
+
+    print(f"cpu cores: {os.cpu_count()}")
+    print(f"{'workers':>8} {'episodes':>9} {'seconds':>8} {'episodes/hour':>14} {'examples/hour':>14} {'sims/example':>13}")
+    for workers in opts.workers:
+        args.num_workers = workers
+        start = time.perf_counter()
+        episodes = examples = sims = 0
+        for episode, stats in parallel_self_play(game, nnet, args, opts.episodes):
+            episodes += 1
+            examples += len(episode)
+            sims += stats['sims']
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {episodes:>9} {elapsed:>8.1f} {episodes * 3600 / elapsed:>14.0f} "
+              f"{examples * 3600 / elapsed:>14.0f} {sims / max(examples, 1):>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# /predict latency under concurrent clients against a local uvicorn.
+#
+#   python -m benchmarks.bench_server --clients 1 2 4 8 --requests 4
+#
+# Starts `uvicorn server:app` on a free port (extra environment such as
+# SEARCH_WORKERS is passed through), waits for /health, then has each client
+# send stateless /predict requests for fixed random positions. The position
+# cache is off (POSITION_CACHE_SIZE=0 unless set) so every request searches.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("server did not become healthy")
+
+
+@contextmanager
+def local_server(env=None):
+    # Yields the URL of a uvicorn server:app on a free port
+    port = free_port()
+    env = {**os.environ, **(env or {})}
+    env.setdefault('POSITION_CACHE_SIZE', '0')
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(port), '--log-level', 'warning'],
+                              env=env)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        wait_healthy(url)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def positions(n, count, stones, seed=0):
+    rng = np.random.default_rng(seed)
+    result = []
+    for _ in range(count):
+        board = np.zeros(n * n, dtype=int)
+        cells = rng.choice(n * n, size=2 * stones, replace=False)
+        board[cells[:stones]] = 1
+        board[cells[stones:]] = -1
+        result.append(board.reshape(n, n).tolist())
+    return result
+
+
+def post(url, payload):
+    request = urllib.request.Request(f"{url}/predict", data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.perf_counter() - start, status
+
+
+def run_clients(url, boards, clients, requests):
+    def client(i):
+        return [post(url, {'grid': boards[(i * requests + j) % len(boards)], 'currentPlayer': 1})
+                for j in range(requests)]
+
+    with ThreadPoolExecutor(clients) as pool:
+        results = [r for rs in pool.map(client, range(clients)) for r in rs]
+    latencies = np.array([t for t, status in results if status == 200]) * 1000
+    rejected = sum(status == 503 for _, status in results)
+    return latencies, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=4, help="requests per client")
+    parser.add_argument('--size', type=int, default=8)
+    parser.add_argument('--url', default=None, help="use an already running server instead of starting one")
+    opts = parser.parse_args()
+
+    with (nullcontext(opts.url) if opts.url else local_server()) as url:
+        wait_healthy(url)
+        boards = positions(opts.size, 32, stones=3)
+        post(url, {'grid': boards[0], 'currentPlayer': 1})  # warm-up
+
+        print(f"{'clients':>8} {'ok':>5} {'503':>5} {'p50 ms':>9} {'p99 ms':>9}")
+        for clients in opts.clients:
+            latencies, rejected = run_clients(url, boards, clients, opts.requests)
+            p50, p99 = (np.percentile(latencies, [50, 99]) if len(latencies) else (float('nan'),) * 2)
+            print(f"{clients:>8} {len(latencies):>5} {rejected:>5} {p50:>9.1f} {p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
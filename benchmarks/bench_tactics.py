@@ -0,0 +1,128 @@
+# Tactical strength and per-move cost of MCTS with the threat solver
+# (args.tactics) on and off, at a low simulation count.
+#
+#   python -m benchmarks.bench_tactics --size 15 --sims 50 --puzzles 30
+#
+# Puzzles are positions from random games (moves near the stones already on
+# the board) that a reference solver with a large budget classifies as:
+#   vcf    the player to move wins by continuous fours, but not at once
+#   block  the opponent threatens five on one square: the only move
+# A vcf puzzle counts as solved when the chosen move keeps the win; a block
+# puzzle when the chosen move is the block. Uses a randomly initialised
+# GomokuNet, so everything solved comes from the search, not the network.
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from game import GomokuGame
+from model import GomokuNet
+from mcts import make_mcts
+from tactics import TacticalSolver, WIN, LOSS, FORCED
+from benchmarks.bench_mcts import Args
+
+
+class CountingNet:
+    # predict() wrapper that counts evaluated positions
+    def __init__(self, nnet):
+        self.nnet = nnet
+        self.positions = 0
+
+    def predict(self, boards):
+        self.positions += len(boards)
+        return self.nnet.predict(boards)
+
+
+def random_move(game, board, rng):
+    # A random empty cell within two cells of a stone (the centre on an empty board)
+    n = game.n
+    stones = np.argwhere(board != 0)
+    if len(stones) == 0:
+        return (n // 2) * n + n // 2
+    near = np.zeros((n, n), dtype=bool)
+    for r, c in stones:
+        near[max(r - 2, 0):r + 3, max(c - 2, 0):c + 3] = True
+    return int(rng.choice(np.flatnonzero(near & (board == 0))))
+
+
+def make_puzzles(game, reference, count, seed):
+    rng = np.random.default_rng(seed)
+    puzzles = {'vcf': [], 'block': []}
+    while min(len(p) for p in puzzles.values()) < count:
+        board, player = game.get_init_board(), 1
+        for _ in range(game.n * game.n // 2):
+            canonical = game.get_canonical_form(board, player)
+            status, squares = reference.analyze(canonical)
+            if status == WIN and len(squares) > 1 and len(puzzles['vcf']) < count:
+                puzzles['vcf'].append(canonical)
+            elif status == FORCED and len(puzzles['block']) < count:
+                puzzles['block'].append((canonical, squares[0]))
+            if status is not None:
+                break # play on from a fresh game, not from a decided one
+            a = random_move(game, board, rng)
+            board, player = game.get_next_state(board, player, a)
+    return puzzles
+
+
+def keeps_win(game, reference, canonical, a):
+    # After the attacker plays a: five, or every defence still loses to a VCF
+    if game.is_winning_move(canonical, 1, a):
+        return True
+    board = canonical.copy()
+    board.flat[a] = 1
+    status, squares = reference.analyze(-board)
+    if status == LOSS:
+        return True
+    if status != FORCED:
+        return False
+    board.flat[squares[0]] = -1
+    return reference.analyze(board)[0] == WIN
+
+
+def run(game, nnet, puzzles, reference, tactics, sims):
+    args = Args()
+    args.numMCTSSims = sims
+    args.tactics = tactics
+    args.vcf_max_nodes = 100
+    net = CountingNet(nnet)
+    solved, moves, seconds = {}, 0, 0.0
+    for kind, items in puzzles.items():
+        solved[kind] = 0
+        for item in items:
+            canonical, block = (item, None) if kind == 'vcf' else item
+            mcts = make_mcts(game, net, args)
+            start = time.perf_counter()
+            a = int(np.argmax(mcts.getActionProb(canonical, temp=0)))
+            seconds += time.perf_counter() - start
+            moves += 1
+            solved[kind] += keeps_win(game, reference, canonical, a) if kind == 'vcf' else a == block
+    return solved, seconds / moves, net.positions / moves
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=15)
+    parser.add_argument('--sims', type=int, default=50)
+    parser.add_argument('--puzzles', type=int, default=30, help="puzzles of each kind")
+    parser.add_argument('--seed', type=int, default=0)
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    np.random.seed(opts.seed)
+    game = GomokuGame(n=opts.size)
+    nnet = GomokuNet(game)
+    nnet.eval()
+    reference = TacticalSolver(game, vcf_max_nodes=10000)
+    puzzles = make_puzzles(game, reference, opts.puzzles, opts.seed)
+
+    print(f"{opts.size}x{opts.size}, {opts.sims} sims, {opts.puzzles} puzzles of each kind")
+    print(f"{'tactics':>8} {'vcf solved':>11} {'block solved':>13} {'ms/move':>8} {'NN evals/move':>14}")
+    for tactics in (False, True):
+        solved, seconds, evals = run(game, nnet, puzzles, reference, tactics, opts.sims)
+        print(f"{'on' if tactics else 'off':>8} {solved['vcf']:>11} {solved['block']:>13} "
+              f"{seconds * 1000:>8.1f} {evals:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Training throughput: samples/sec of Trainer.train_neural_net on random
+# examples from a throwaway replay buffer.
+#
+#   python -m benchmarks.bench_train --sizes 8 15 --examples 5000
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+import train
+from game import GomokuGame
+from model import GomokuNet
+
+
+def fill(trainer, game, examples, rng):
+    n = game.n
+    boards = rng.integers(-1, 2, size=(examples, n, n)).astype(np.int8)
+    pis = rng.dirichlet(np.ones(n * n), size=examples).astype(np.float32)
+    vs = rng.choice([-1.0, 1.0], size=examples)
+    trainer.replay.add(list(zip(boards, pis, vs)), 0)
+
+
+def bench(n, examples, epochs, batch_size, device):
+    game = GomokuGame(n=n)
+    nnet = GomokuNet(game).to(device)
+    args = train.Args()
+    args.epochs = epochs
+    args.batch_size = batch_size
+    args.device = device
+    args.maxlenOfQueue = examples
+
+    with tempfile.TemporaryDirectory() as folder:
+        args.checkpoint = folder
+        # Trainer writes TensorBoard events under ./runs: keep them out of the repo
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            trainer = train.Trainer(game, nnet, args)
+            fill(trainer, game, examples, np.random.default_rng(0))
+            slots = trainer.replay.recent(0, 1)
+
+            start = time.perf_counter()
+            trainer.train_neural_net(slots)
+            elapsed = time.perf_counter() - start
+            trainer.writer.close()
+        finally:
+            os.chdir(cwd)
+    return epochs * (len(slots) // batch_size) * batch_size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--examples', type=int, default=5000)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--device', default='cpu')
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    results = []
+    for n in opts.sizes:
+        results.append((n, bench(n, opts.examples, opts.epochs, opts.batch_size, opts.device)))
+    print(f"{'board':>6} {'batch':>6} {'samples/sec':>12}")
+    for n, rate in results:
+        print(f"{n:>4}x{n:<2} {opts.batch_size:>6} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
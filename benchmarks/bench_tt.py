@@ -0,0 +1,94 @@
+# Position keys: board.tobytes() (dict MCTS) versus 64-bit Zobrist hashes
+# (ArrayMCTS transposition table) - key memory, lookup time and memory per
+# search node.
+#
+#   python -m benchmarks.bench_tt --sizes 8 15
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from game import GomokuGame
+from mcts import MCTS, ArrayMCTS
+from model import GomokuNet
+
+
+class Args:
+    numMCTSSims = 200
+    cpuct = 1.0
+    mcts_batch_size = 8
+
+
+def random_walk(game, plies, seed=0):
+    # Boards (canonical for the side to move) and the move leading to each
+    rng = np.random.default_rng(seed)
+    board, player, boards, moves = game.get_init_board(), 1, [], []
+    for _ in range(plies):
+        a = int(rng.choice(np.flatnonzero(board.reshape(-1) == 0)))
+        board, player = game.get_next_state(board, player, a)
+        boards.append(game.get_canonical_form(board, player))
+        moves.append(a)
+    return boards, moves
+
+
+def lookup_us(game, boards, moves, repeat):
+    bytes_table = {b.tobytes(): i for i, b in enumerate(boards)}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for b in boards:
+            bytes_table.get(b.tobytes())
+    bytes_time = (time.perf_counter() - start) / (repeat * len(boards))
+
+    # Zobrist: the key is updated from the parent's key, as in ArrayMCTS._descend
+    hashes = [game.hash_board(b) for b in boards]
+    zobrist_table = {h: i for i, h in enumerate(hashes)}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        h = 0
+        for a in moves:
+            h = game.update_hash(h, a, 1)
+            zobrist_table.get(h)
+    zobrist_time = (time.perf_counter() - start) / (repeat * len(boards))
+    return bytes_time * 1e6, zobrist_time * 1e6
+
+
+def bytes_per_node(game, nnet, cls):
+    mcts = cls(game, nnet, Args())
+    if cls is ArrayMCTS:
+        # One row of every node array (allocated capacity is rounded up to a power of two)
+        return mcts.memory_bytes() / mcts.capacity
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    mcts.getActionProb(game.get_init_board())
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(mcts.Es)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[8, 15])
+    parser.add_argument('--repeat', type=int, default=200)
+    opts = parser.parse_args()
+
+    torch.manual_seed(0)
+    print(f"{'board':>6} {'key bytes':>10} {'zobrist':>8} {'lookup us':>10} {'zobrist us':>11} "
+          f"{'dict B/node':>12} {'array B/node':>13}")
+    for n in opts.sizes:
+        game = GomokuGame(n=n)
+        nnet = GomokuNet(game)
+        boards, moves = random_walk(game, n * n // 3)
+        bytes_key = sys.getsizeof(boards[0].tobytes())
+        zobrist_key = sys.getsizeof(game.hash_board(boards[-1]))
+        bytes_us, zobrist_us = lookup_us(game, boards, moves, opts.repeat)
+        dict_node = bytes_per_node(game, nnet, MCTS)
+        array_node = bytes_per_node(game, nnet, ArrayMCTS)
+        print(f"{n:>4}x{n:<2} {bytes_key:>10} {zobrist_key:>8} {bytes_us:>10.2f} {zobrist_us:>11.2f} "
+              f"{dict_node:>12.0f} {array_node:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Compares two result files of benchmarks.suite, metric by metric:
+#
+#   python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<new>.json
+#
+# A metric is flagged as a regression (or improvement) when it moved the
+# wrong (or right) way by more than --threshold (default 5%) and by more
+# than its noise, taken as the relative spread (max - min) / median of the
+# samples in either file. Exits with status 1 if anything regressed, so the
+# comparison can gate a CI job.
+import argparse
+import json
+import sys
+
+# Metadata that makes two runs incomparable when it differs
+SETUP_KEYS = ['quick', 'threads', 'torch', 'numpy', 'python', 'processor', 'cpus']
+
+
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def spread(metric):
+    samples = metric.get('samples') or [metric['value']]
+    return (max(samples) - min(samples)) / metric['value'] if metric['value'] else 0.0
+
+
+def compare(base, new, threshold):
+    # [(name, base metric, new metric, relative change, verdict)] for the
+    # metrics in both runs; verdict is 'regression', 'improvement' or ''
+    rows = []
+    for name in sorted(set(base) & set(new)):
+        b, n = base[name], new[name]
+        change = (n['value'] - b['value']) / b['value'] if b['value'] else 0.0
+        gained = change if b['better'] == 'higher' else -change
+        verdict = ''
+        if abs(change) > max(threshold, spread(b), spread(n)):
+            verdict = 'improvement' if gained > 0 else 'regression'
+        rows.append((name, b, n, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.05, help="relative change that counts")
+    opts = parser.parse_args()
+
+    base, new = load(opts.base), load(opts.new)
+    print(f"base {base['meta']['commit']}{' (dirty)' if base['meta']['dirty'] else ''}, "
+          f"new {new['meta']['commit']}{' (dirty)' if new['meta']['dirty'] else ''}")
+    for key in SETUP_KEYS:
+        if base['meta'].get(key) != new['meta'].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {new['meta'].get(key)})")
+
+    rows = compare(base['results'], new['results'], opts.threshold)
+    print(f"{'metric':<40} {'base':>12} {'new':>12} {'change':>8}  unit")
+    for name, b, n, change, verdict in rows:
+        print(f"{name:<40} {b['value']:>12.2f} {n['value']:>12.2f} {change:>+8.1%}  {b['unit']:<10} {verdict}")
+    for name in sorted(set(base['results']) ^ set(new['results'])):
+        print(f"{name:<40} only in {'base' if name in base['results'] else 'new'}")
+
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    improvements = [row[0] for row in rows if row[4] == 'improvement']
+    print(f"{len(regressions)} regressions, {len(improvements)} improvements, "
+          f"{len(rows) - len(regressions) - len(improvements)} unchanged")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# The benchmarks that matter for regressions, run with fixed seeds on fixed
+# positions and written to one JSON file so two commits can be compared:
+#
+#   python -m benchmarks.suite                        # -> benchmarks/results/<commit>.json
+#   git checkout other-branch && python -m benchmarks.suite
+#   python -m benchmarks.compare benchmarks/results/<base>.json benchmarks/results/<new>.json
+#
+# Groups (--groups selects some of them):
+#   game    move generation and win checks per second, per board size
+#   mcts    sims/sec at 100 / 400 / 1600 simulations, both backends
+#   model   GomokuNet forward latency per batch size
+#   train   Trainer.train_neural_net samples/sec
+#   server  /predict p50 / p99 latency under concurrent clients (local uvicorn)
+# Every measurement is repeated --repeat times; the file keeps the median
+# and the individual samples, which compare.py uses as the noise level.
+# Torch runs on --threads intra-op threads (default 1) so that results
+# depend as little as possible on what else the machine is doing.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+import torch
+
+from game import GomokuGame
+from model import GomokuNet
+from benchmarks import bench_game, bench_mcts, bench_model, bench_server, bench_train
+
+GROUPS = ['game', 'mcts', 'model', 'train', 'server']
+
+
+class Results:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.metrics = {}
+
+    def measure(self, name, unit, better, fn, warmup=True):
+        # fn() -> one sample; better: 'higher' or 'lower'. The warm-up
+        # sample (lazily built tables, allocator, CPU clock) is dropped.
+        if warmup:
+            fn()
+        samples = [float(fn()) for _ in range(self.repeat)]
+        self.metrics[name] = {'value': float(np.median(samples)), 'unit': unit, 'better': better, 'samples': samples}
+        print(f"{name:<40} {self.metrics[name]['value']:>12.2f} {unit}")
+
+
+def bench_game_group(results, sizes):
+    for n in sizes:
+        game = GomokuGame(n=n)
+        positions = bench_game.random_positions(game, 50, fill=0.3, seed=0)
+        boards = [(board,) for board, _, _, _ in positions]
+        results.measure(f"game.{n}x{n}.valid_moves", 'calls/s', 'higher',
+                        lambda: 1 / bench_game.time_per_call(game.get_valid_moves, boards, 20))
+        results.measure(f"game.{n}x{n}.candidate_moves", 'calls/s', 'higher',
+                        lambda: 1 / bench_game.time_per_call(lambda b: game.candidate_moves(b, 2), boards, 20))
+        results.measure(f"game.{n}x{n}.move_result", 'calls/s', 'higher',
+                        lambda: 1 / bench_game.time_per_call(game.get_move_result, positions, 20))
+        results.measure(f"game.{n}x{n}.game_ended", 'calls/s', 'higher',
+                        lambda: 1 / bench_game.time_per_call(lambda b, p, a, e: game.get_game_ended(b, -p), positions, 20))
+
+
+def bench_mcts_group(results, sizes, sims_list):
+    # The configurations train.py and server.py ship with: array backend
+    # with 8 leaves per NN call, and the dict backend; move radius 2
+    for n in sizes:
+        game = GomokuGame(n=n)
+        torch.manual_seed(0)
+        nnet = GomokuNet(game)
+        nnet.eval()
+        for backend, k in (('array', 8), ('dict', 1)):
+            for sims in sims_list:
+                results.measure(f"mcts.{backend}.{n}x{n}.sims{sims}", 'sims/s', 'higher',
+                                lambda: bench_mcts.bench(game, nnet, backend, sims, k, radius=2))
+
+
+def bench_model_group(results, sizes, batch_sizes):
+    for n in sizes:
+        game = GomokuGame(n=n)
+        torch.manual_seed(0)
+        nnet = GomokuNet(game)
+        nnet.eval()
+        for b in batch_sizes:
+            results.measure(f"model.conv.{n}x{n}.batch{b}", 'ms', 'lower',
+                            lambda: bench_model.latency_ms(nnet, n, b, 20))
+
+
+def bench_train_group(results, sizes, examples):
+    for n in sizes:
+        def sample():
+            torch.manual_seed(0)
+            np.random.seed(0) # the order examples are drawn in
+            return bench_train.bench(n, examples, epochs=1, batch_size=64, device='cpu')
+        results.measure(f"train.{n}x{n}.batch64", 'samples/s', 'higher', sample, warmup=False)
+
+
+def bench_server_group(results, clients_list, requests):
+    # One server for all samples: a restart per sample would mostly measure
+    # model loading. The cache is off, so every request searches.
+    with bench_server.local_server({'BOARD_SIZE': '8', 'PONDER_WORKERS': '0'}) as url:
+        boards = bench_server.positions(8, 32, stones=3)
+        bench_server.post(url, {'grid': boards[0], 'currentPlayer': 1}) # warm-up
+        for clients in clients_list:
+            runs = [bench_server.run_clients(url, boards, clients, requests)[0] for _ in range(results.repeat)]
+            for q in (50, 99):
+                samples = iter([np.percentile(latencies, q) for latencies in runs])
+                results.measure(f"server.predict.clients{clients}.p{q}", 'ms', 'lower', lambda: next(samples), warmup=False)
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD']) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--groups', nargs='+', default=GROUPS, choices=GROUPS)
+    parser.add_argument('--quick', action='store_true', help="smaller boards and searches, for a fast smoke run")
+    parser.add_argument('--repeat', type=int, default=3, help="samples per measurement")
+    parser.add_argument('--threads', type=int, default=1, help="torch intra-op threads")
+    parser.add_argument('--out', default=None, help="defaults to benchmarks/results/<commit>.json")
+    opts = parser.parse_args()
+
+    torch.set_num_threads(opts.threads)
+    np.random.seed(0)
+    sizes = [8] if opts.quick else [8, 15]
+    commit, dirty = git_commit()
+    meta = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.time(),
+        'quick': opts.quick,
+        'repeat': opts.repeat,
+        'threads': opts.threads,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+    results = Results(opts.repeat)
+    start = time.perf_counter()
+    if 'game' in opts.groups:
+        bench_game_group(results, sizes)
+    if 'mcts' in opts.groups:
+        bench_mcts_group(results, sizes, [100, 400] if opts.quick else [100, 400, 1600])
+    if 'model' in opts.groups:
+        bench_model_group(results, sizes, [1, 8, 64])
+    if 'train' in opts.groups:
+        bench_train_group(results, sizes, 1000 if opts.quick else 5000)
+    if 'server' in opts.groups:
+        bench_server_group(results, [1, 4] if opts.quick else [1, 4, 8], 2 if opts.quick else 4)
+    meta['seconds'] = time.perf_counter() - start
+
+    out = opts.out or os.path.join('benchmarks', 'results', f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'meta': meta, 'results': results.metrics}, f, indent=2)
+    print(f"Wrote {len(results.metrics)} results to {out} ({meta['seconds']:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
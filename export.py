@@ -0,0 +1,149 @@
+import argparse
+import copy
+import io
+import json
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import fuse_modules, quantize_dynamic
+
+from arena import Arena, mcts_player
+from game import GomokuGame
+from model import make_model
+
+# --- Inference export ---
+# Turns a trained network into a CPU inference artifact:
+#   1. BatchNorm layers are folded into the conv / linear layer before them
+#   2. Linear layers are dynamically quantized to int8 (optional)
+#   3. the result is traced to TorchScript, which runs without the eager
+#      Python module dispatch
+# The artifact is a TorchScript file with the model config stored alongside,
+# loaded with load_exported(). ExportedModel has the same predict() as
+# GomokuModel, so MCTS, the inference broker and the server use it unchanged.
+#
+#   python export.py --checkpoint checkpoint/best.pth.tar --out checkpoint/best.ts --quantize
+#   python export.py ... --compare 20    # arena: exported vs fp32, plus latency per batch size
+
+def fusion_groups(model):
+    # [conv/linear, batchnorm] name pairs: every BatchNorm is registered right
+    # after the layer it normalizes
+    groups, previous = [], None
+    for name, module in model.named_modules():
+        if isinstance(module, (nn.BatchNorm1d, nn.BatchNorm2d)) and previous is not None:
+            groups.append([previous, name])
+        previous = name if isinstance(module, (nn.Conv2d, nn.Linear)) else None
+    return groups
+
+def export_model(nnet, n, quantize=True):
+    # Returns a TorchScript module for CPU inference on n x n boards
+    model = copy.deepcopy(nnet).cpu().eval()
+    model = fuse_modules(model, fusion_groups(model))
+    if quantize:
+        model = quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model, torch.zeros(2, n, n)))
+
+def save_exported(script, path, config):
+    torch.jit.save(script, path, _extra_files={'config.json': json.dumps(config)})
+
+def export_bytes(nnet, n, quantize=True):
+    # Serialized export_model(), for handing to worker processes
+    buffer = io.BytesIO()
+    save_exported(export_model(nnet, n, quantize), buffer, {'n': n, 'quantize': quantize})
+    return buffer.getvalue()
+
+class ExportedModel:
+    # predict() over a TorchScript artifact written by save_exported
+    def __init__(self, script, config):
+        self.script = script
+        self.config = config
+
+    def predict(self, boards):
+        s = torch.from_numpy(np.ascontiguousarray(boards, dtype=np.float32))
+        with torch.no_grad():
+            pi, v = self.script(s)
+        return torch.exp(pi).numpy(), v.view(-1).numpy()
+
+def load_exported(path_or_bytes):
+    if isinstance(path_or_bytes, bytes):
+        path_or_bytes = io.BytesIO(path_or_bytes)
+    extra = {'config.json': ''}
+    script = torch.jit.load(path_or_bytes, map_location='cpu', _extra_files=extra)
+    return ExportedModel(script, json.loads(extra['config.json']))
+
+def inference_model(nnet, game, args):
+    # The model self-play should search with: nnet itself, or with
+    # args.export_inference a fresh export of its current weights
+    if not getattr(args, 'export_inference', False):
+        return nnet
+    return load_exported(export_bytes(nnet, game.n, getattr(args, 'quantize_inference', True)))
+
+# --- Checks ---
+
+def latency_table(models, n, batch_sizes, repeat=20):
+    # ms per predict() call for each named model and batch size
+    rows = []
+    for name, model in models:
+        times = []
+        for b in batch_sizes:
+            boards = np.random.default_rng(0).integers(-1, 2, size=(b, n, n)).astype(np.int8)
+            model.predict(boards) # warm-up
+            start = time.perf_counter()
+            for _ in range(repeat):
+                model.predict(boards)
+            times.append((time.perf_counter() - start) / repeat * 1000)
+        rows.append((name, times))
+    return rows
+
+def compare_strength(game, exported, reference, args, num_games):
+    # Arena between MCTS on the exported model and MCTS on the fp32 model
+    arena = Arena(mcts_player(game, exported, args), mcts_player(game, reference, args), game)
+    return arena.play_games(num_games)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', default='checkpoint/best.pth.tar')
+    parser.add_argument('--out', default='checkpoint/best.ts')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--model-arch', default='conv')
+    parser.add_argument('--num-channels', type=int, default=64)
+    parser.add_argument('--num-res-blocks', type=int, default=6)
+    parser.add_argument('--quantize', action='store_true', help="int8 dynamic quantization of Linear layers")
+    parser.add_argument('--compare', type=int, default=0, metavar='GAMES',
+                        help="play this many arena games exported vs fp32 and print a latency table")
+    parser.add_argument('--sims', type=int, default=50, help="MCTS simulations per move in --compare games")
+    opts = parser.parse_args()
+
+    class Args:
+        model_arch = opts.model_arch
+        num_channels = opts.num_channels
+        num_res_blocks = opts.num_res_blocks
+        numMCTSSims = opts.sims
+        cpuct = 1.0
+        mcts_backend = 'array'
+        mcts_batch_size = 8
+
+    game = GomokuGame(n=opts.board_size)
+    nnet = make_model(game, Args)
+    nnet.load_checkpoint(*os.path.split(opts.checkpoint))
+    nnet.eval()
+
+    config = {'n': opts.board_size, 'model_arch': opts.model_arch, 'quantize': opts.quantize}
+    save_exported(export_model(nnet, opts.board_size, opts.quantize), opts.out, config)
+    print(f"Exported {opts.checkpoint} to {opts.out} ({config})")
+
+    if opts.compare:
+        exported = load_exported(opts.out)
+        wins, losses, draws = compare_strength(game, exported, nnet, Args, opts.compare)
+        print(f"Exported vs fp32: {wins} wins, {losses} losses, {draws} draws "
+              f"(score {(wins + 0.5 * draws) / opts.compare:.3f})")
+
+        batch_sizes = [1, 8, 64]
+        print(f"{'model':>10} " + ' '.join(f"{f'ms@{b}':>8}" for b in batch_sizes))
+        for name, times in latency_table([('fp32', nnet), ('exported', exported)], opts.board_size, batch_sizes):
+            print(f"{name:>10} " + ' '.join(f"{t:>8.2f}" for t in times))
+
+if __name__ == "__main__":
+    main()
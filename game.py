@@ -1,11 +1,27 @@
 import numpy as np
 
+# Directions: horizontal, vertical, diagonal, anti-diagonal
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
 class GomokuGame:
     def __init__(self, n=15):
         self.n = n
+        # Zobrist keys: one random 64-bit key per cell for a stone of the
+        # player to move (column 0) and one for an opponent stone (column 1).
+        # The seed is fixed so hashes agree across processes and runs.
+        self.zobrist = np.random.default_rng(0x5EED).integers(0, 2**64, size=(n * n, 2), dtype=np.uint64)
+        self._zobrist = self.zobrist.tolist() # Python ints, faster for single updates
+
+        # Dihedral symmetries: symmetry_perms[k][a] is where cell a lands
+        # after transform(board, k)
+        cells = np.arange(n * n).reshape(n, n)
+        self.symmetry_perms = np.stack([np.argsort(self.transform(cells, k).reshape(-1)) for k in range(8)])
+
+        self._neighborhoods = {} # radius -> cells within radius of each cell
 
     def get_init_board(self):
-        return np.zeros((self.n, self.n), dtype=int)
+        # int8: 1 byte per cell keeps copies and tobytes() keys small
+        return np.zeros((self.n, self.n), dtype=np.int8)
 
     def get_board_size(self):
         return (self.n, self.n)
@@ -20,14 +36,109 @@ class GomokuGame:
         new_board[r][c] = player
         return new_board, -player
 
+    def get_next_state_with_result(self, board, player, action, empty_count=None):
+        # Like get_next_state, but also returns the game result for the next
+        # player (same convention as get_game_ended(new_board, -player)).
+        # Only the lines through `action` are checked. Callers that track the
+        # number of empty cells on `board` can pass it to skip the board scan.
+        new_board, next_player = self.get_next_state(board, player, action)
+        if empty_count is None:
+            empty_count = self.count_empty(board)
+        return new_board, next_player, self.get_move_result(new_board, player, action, empty_count - 1)
+
+    def get_move_result(self, board, player, action, empty_count):
+        # Result after 'player' has played 'action' on 'board', from the point
+        # of view of the opponent who is now to move: -1 if the move made five,
+        # 1e-4 if it filled the board, 0 otherwise. empty_count is the number
+        # of empty cells left after the move.
+        if self.is_winning_move(board, player, action):
+            return -1
+        if empty_count == 0:
+            return 1e-4 # Draw
+        return 0
+
+    def is_winning_move(self, board, player, action):
+        # True if a 'player' stone at 'action' is part of five in a row.
+        # Only the four lines through 'action' are scanned and the cell itself
+        # is not read, so this also answers "would this move win?" before
+        # the stone is placed.
+        n = self.n
+        r, c = action // n, action % n
+        for dr, dc in DIRECTIONS:
+            count = 1
+            nr, nc = r + dr, c + dc
+            while 0 <= nr < n and 0 <= nc < n and board[nr, nc] == player:
+                count += 1
+                nr, nc = nr + dr, nc + dc
+            nr, nc = r - dr, c - dc
+            while 0 <= nr < n and 0 <= nc < n and board[nr, nc] == player:
+                count += 1
+                nr, nc = nr - dr, nc - dc
+            if count >= 5:
+                return True
+        return False
+
+    def count_empty(self, board):
+        return int(np.count_nonzero(board == 0))
+
+    def make_move(self, board, player, action):
+        # In-place variant of get_next_state for search code that walks down
+        # and back up a single board; undo with unmake_move
+        board[action // self.n, action % self.n] = player
+
+    def unmake_move(self, board, action):
+        board[action // self.n, action % self.n] = 0
+
     def get_valid_moves(self, board):
         # Returns a binary vector of size n*n
-        valid = np.zeros(self.n * self.n)
-        for r in range(self.n):
-            for c in range(self.n):
-                if board[r][c] == 0:
-                    valid[r * self.n + c] = 1
-        return valid
+        return (board.reshape(-1) == 0).astype(np.float64)
+
+    # --- Candidate moves ---
+    # Strong moves are almost always close to the stones already on the
+    # board. A neighbour count array holds, for every cell, the number of
+    # stones within `radius` cells of it (in any direction); search code
+    # keeps it up to date move by move with add_neighbors / remove_neighbors
+    # instead of rescanning the board. Candidate moves are the empty cells
+    # with a nonzero count.
+
+    def neighborhood(self, radius):
+        # neighborhood(radius)[a]: flat indices of the cells at most radius rows and columns from a
+        if radius not in self._neighborhoods:
+            n = self.n
+            cells = []
+            for a in range(n * n):
+                r, c = a // n, a % n
+                rows = np.arange(max(r - radius, 0), min(r + radius + 1, n))
+                cols = np.arange(max(c - radius, 0), min(c + radius + 1, n))
+                cells.append((rows[:, None] * n + cols).reshape(-1))
+            self._neighborhoods[radius] = cells
+        return self._neighborhoods[radius]
+
+    def neighbor_counts(self, board, radius):
+        counts = np.zeros(self.n * self.n, dtype=np.int16)
+        cells = self.neighborhood(radius)
+        for a in np.flatnonzero(board.reshape(-1)):
+            counts[cells[a]] += 1
+        return counts
+
+    def add_neighbors(self, counts, action, radius):
+        # A stone was placed on 'action'
+        counts[self.neighborhood(radius)[action]] += 1
+
+    def remove_neighbors(self, counts, action, radius):
+        counts[self.neighborhood(radius)[action]] -= 1
+
+    def candidate_moves(self, board, radius, counts=None, out=None):
+        # Boolean vector of the valid moves within radius of a stone; all
+        # valid moves if radius is 0 or no cell qualifies (e.g. an empty
+        # board). counts: neighbor_counts(board, radius), if already tracked.
+        valids = np.equal(board.reshape(-1), 0, out=out)
+        if radius > 0:
+            counts = self.neighbor_counts(board, radius) if counts is None else counts
+            near = valids & (counts > 0)
+            if near.any():
+                valids[:] = near
+        return valids
 
     def get_game_ended(self, board, player):
         # returns 1 if player won, -1 if player lost, 0 if not ended, 1e-4 for draw
@@ -43,22 +154,19 @@ class GomokuGame:
         if self.check_win(board, -player):
             return -1
             
-        if np.sum(board == 0) == 0:
+        if self.count_empty(board) == 0:
             return 1e-4 # Draw
             
         return 0
 
     def check_win(self, board, player):
         n = self.n
-        # Directions: horizontal, vertical, diagonal, anti-diagonal
-        directions = [(0, 1), (1, 0), (1, 1), (1, -1)]
-        
         for r in range(n):
             for c in range(n):
                 if board[r][c] != player:
                     continue
                 
-                for dr, dc in directions:
+                for dr, dc in DIRECTIONS:
                     count = 0
                     for i in range(5):
                         nr, nc = r + dr*i, c + dc*i
@@ -77,3 +185,51 @@ class GomokuGame:
 
     def string_representation(self, board):
         return board.tobytes()
+
+    def hash_board(self, board):
+        # 64-bit Zobrist hash of a canonical board (+1 = player to move)
+        flat = board.reshape(-1)
+        cells = np.flatnonzero(flat)
+        return int(np.bitwise_xor.reduce(self.zobrist[cells, (flat[cells] < 0).astype(np.intp)]))
+
+    def update_hash(self, h, action, stone):
+        # Hash after a stone (+1 or -1, in the hashed board's colours) is placed on 'action'
+        return h ^ self._zobrist[action][0 if stone == 1 else 1]
+
+    def canonical_hash(self, board):
+        # Smallest Zobrist hash over the 8 symmetries of a canonical board,
+        # and the k with canonical_hash == hash_board(transform(board, k))
+        flat = board.reshape(-1)
+        cells = np.flatnonzero(flat)
+        keys = np.bitwise_xor.reduce(self.zobrist[self.symmetry_perms[:, cells], (flat[cells] < 0).astype(np.intp)], axis=1)
+        k = int(np.argmin(keys))
+        return int(keys[k]), k
+
+    # --- Symmetries ---
+    # The board and its policy are equivalent under the 8 rotations and
+    # reflections of the square. k = 0..3 rotates k quarter turns, k = 4..7
+    # additionally mirrors left-right.
+
+    def transform(self, board, k):
+        # Acts on the last two axes, so it also transforms stacks of boards
+        board = np.rot90(board, k % 4, axes=(-2, -1))
+        return np.flip(board, axis=-1) if k >= 4 else board
+
+    def get_symmetry(self, board, pi, k):
+        pi = np.reshape(pi, (self.n, self.n))
+        return np.ascontiguousarray(self.transform(board, k)), self.transform(pi, k).reshape(-1)
+
+    def get_symmetries(self, board, pi):
+        # List of the 8 (board, pi) pairs equivalent to (board, pi)
+        return [self.get_symmetry(board, pi, k) for k in range(8)]
+
+    def get_batch_symmetry(self, boards, pis, ks):
+        # Applies symmetry ks[i] to the i-th (board, pi) of a batch
+        boards, pis = boards.copy(), pis.reshape(-1, self.n, self.n).copy()
+        for k in range(1, 8):
+            sel = ks == k
+            if sel.any():
+                boards[sel] = self.transform(boards[sel], k)
+                pis[sel] = self.transform(pis[sel], k)
+        return boards, pis.reshape(len(pis), -1)
+
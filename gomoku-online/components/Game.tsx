@@ -29,6 +29,10 @@ export const Game: React.FC<GameProps> = ({ config, mode, onGameEnd, onExit }) =
     const [isDraw, setIsDraw] = useState(false);
     const [isAiThinking, setIsAiThinking] = useState(false);
     const [isOverlayVisible, setIsOverlayVisible] = useState(true);
+    // Lets the server continue its search tree from one AI move to the next.
+    // crypto.randomUUID only exists in secure contexts (https or localhost).
+    const [sessionId] = useState(() =>
+        crypto.randomUUID?.() ?? Math.random().toString(36).slice(2) + Date.now().toString(36));
 
     // AI Turn Logic
     useEffect(() => {
@@ -51,7 +55,8 @@ export const Game: React.FC<GameProps> = ({ config, mode, onGameEnd, onExit }) =
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({
                             grid: apiGrid,
-                            currentPlayer: -1 // AI is always Player B (-1) in this setup
+                            currentPlayer: -1, // AI is always Player B (-1) in this setup
+                            sessionId
                         })
                     });
 
@@ -71,7 +76,7 @@ export const Game: React.FC<GameProps> = ({ config, mode, onGameEnd, onExit }) =
             const timer = setTimeout(makeAiMove, 500);
             return () => clearTimeout(timer);
         }
-    }, [currentPlayer, grid, mode, winner, isDraw]);
+    }, [currentPlayer, grid, mode, winner, isDraw, sessionId]);
 
     const handleCellClick = (row: number, col: number, isAiMove = false) => {
         // Block interaction if AI is thinking or game over
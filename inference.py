@@ -0,0 +1,246 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+
+# --- Centralized inference ---
+# One evaluator owns the GomokuNet; MCTS actors (threads or processes) hold an
+# InferenceClient instead of a network. A client writes its leaf boards into
+# its own slot of a shared-memory buffer and puts a small (actor, count, time)
+# message on the request queue. The evaluator thread gathers requests into a
+# dynamic batch until it has max_batch_size boards or max_wait_ms has passed,
+# runs one forward pass, writes policy/value back into the slots and wakes
+# each actor through its semaphore. If the forward pass raises, the error
+# text goes into the error slot of every actor in that batch instead, the
+# actors are woken all the same and their predict() raises it; the
+# evaluator keeps serving the next batches. stop() fails the requests still
+# queued the same way, and predict() raises at once once the broker is
+# closed, so no actor is left waiting on an evaluator that has gone.
+
+# Bytes of error text kept per actor
+ERROR_BYTES = 512
+
+class InferenceClient:
+    # Drop-in replacement for GomokuNet.predict inside MCTS
+    def __init__(self, shm_name, num_actors, max_leaves, n, actor_id, requests, ready, closed):
+        self.shm_name = shm_name
+        self.num_actors = num_actors
+        self.max_leaves = max_leaves
+        self.n = n
+        self.actor_id = actor_id
+        self.requests = requests
+        self.ready = ready
+        self.closed = closed
+        self._shm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shm'] = None
+        return state
+
+    def _attach(self):
+        self._shm = shared_memory.SharedMemory(name=self.shm_name)
+        boards, probs, values, errors = _buffers(self._shm, self.num_actors, self.max_leaves, self.n)
+        self.boards = boards[self.actor_id]
+        self.probs = probs[self.actor_id]
+        self.values = values[self.actor_id]
+        self.error = errors[self.actor_id]
+
+    def predict(self, boards):
+        if self.closed.is_set():
+            raise RuntimeError("Inference broker is stopped")
+        if self._shm is None:
+            self._attach()
+        if len(boards) > self.max_leaves:
+            parts = [self.predict(boards[i:i + self.max_leaves]) for i in range(0, len(boards), self.max_leaves)]
+            return np.concatenate([p for p, _ in parts]), np.concatenate([v for _, v in parts])
+
+        k = len(boards)
+        self.boards[:k] = boards
+        self.requests.put((self.actor_id, k, time.monotonic()))
+        # The timeout only covers a request that raced with stop()
+        while not self.ready.acquire(timeout=1.0):
+            if self.closed.is_set():
+                raise RuntimeError("Inference broker is stopped")
+        if self.error[0]:
+            message = bytes(self.error).rstrip(b'\0').decode('utf-8', errors='replace')
+            self.error[:] = 0
+            raise RuntimeError(f"Inference failed in the broker: {message}")
+        return self.probs[:k].copy(), self.values[:k].copy()
+
+def _buffers(shm, num_actors, max_leaves, n):
+    # boards | probs | values, float32 with one slot of max_leaves rows per
+    # actor, then errors: ERROR_BYTES of zero-padded utf-8 text per actor
+    shapes = [(num_actors, max_leaves, n, n), (num_actors, max_leaves, n * n), (num_actors, max_leaves),
+              (num_actors, ERROR_BYTES)]
+    dtypes = [np.float32, np.float32, np.float32, np.uint8]
+    arrays, offset = [], 0
+    for shape, dtype in zip(shapes, dtypes):
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        offset += array.nbytes
+        arrays.append(array)
+    return arrays
+
+def _buffer_bytes(num_actors, max_leaves, n):
+    return 4 * num_actors * max_leaves * (2 * n * n + 1) + num_actors * ERROR_BYTES
+
+class InferenceBroker:
+    def __init__(self, nnet, n, num_actors, max_leaves=8, max_batch_size=64, max_wait_ms=2.0, ctx=None):
+        self.nnet = nnet
+        self.n = n
+        self.num_actors = num_actors
+        self.max_leaves = max_leaves
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        ctx = ctx or mp.get_context()
+        self.requests = ctx.Queue()
+        self.ready = [ctx.Semaphore(0) for _ in range(num_actors)]
+        self.closed = ctx.Event()
+        self.shm = shared_memory.SharedMemory(create=True, size=_buffer_bytes(num_actors, max_leaves, n))
+        self.boards, self.probs, self.values, self.errors = _buffers(self.shm, num_actors, max_leaves, n)
+        self.failed_batches = 0
+
+        # Stats for tuning max_batch_size / max_wait_ms
+        self.batch_sizes = Counter()
+        self.queue_latency = deque(maxlen=100000)
+        self.thread = None
+
+    def client(self, actor_id):
+        return InferenceClient(self.shm.name, self.num_actors, self.max_leaves, self.n,
+                               actor_id, self.requests, self.ready[actor_id], self.closed)
+
+    def clients(self):
+        return [self.client(i) for i in range(self.num_actors)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._serve, name='inference-broker', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+        # Requests queued behind the sentinel, or sent while it was on its way
+        pending = []
+        while True:
+            try:
+                request = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if request is not None:
+                pending.append(request)
+        self._fail(pending, "stopped before this request was served")
+        self.boards = self.probs = self.values = self.errors = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # In-process clients still hold views; the mapping goes away with them
+            pass
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        running = True
+        while running:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch, total = [request], request[1]
+            deadline = time.monotonic() + self.max_wait
+            while total < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+                total += request[1]
+
+            started = time.monotonic()
+            boards = np.concatenate([self.boards[actor, :k] for actor, k, _ in batch])
+            try:
+                probs, values = self.nnet.predict(boards)
+            except Exception as e:
+                self._fail(batch, f"{type(e).__name__}: {e}")
+                self.failed_batches += 1
+                continue
+
+            offset = 0
+            for actor, k, sent in batch:
+                self.probs[actor, :k] = probs[offset:offset + k]
+                self.values[actor, :k] = values[offset:offset + k]
+                offset += k
+                self.queue_latency.append(started - sent)
+                self.ready[actor].release()
+            self.batch_sizes[total] += 1
+
+    def _fail(self, requests, message):
+        # Wakes the actors of `requests` with `message` in their error slots
+        message = message.encode('utf-8')[:ERROR_BYTES]
+        for actor, _, _ in requests:
+            self.errors[actor] = 0
+            self.errors[actor, :len(message)] = np.frombuffer(message, dtype=np.uint8)
+            self.ready[actor].release()
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        evals = sum(size * count for size, count in self.batch_sizes.items())
+        latency_ms = np.array(self.queue_latency) * 1000 if self.queue_latency else np.zeros(1)
+        return {
+            'batches': batches,
+            'failed_batches': self.failed_batches,
+            'evals': evals,
+            'mean_batch_size': evals / batches if batches else 0.0,
+            'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+            'queue_latency_ms': {
+                'p50': float(np.percentile(latency_ms, 50)),
+                'p90': float(np.percentile(latency_ms, 90)),
+                'p99': float(np.percentile(latency_ms, 99)),
+                'max': float(latency_ms.max()),
+            },
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        lat = stats['queue_latency_ms']
+        hist = ' '.join(f"{size}:{count}" for size, count in stats['batch_size_histogram'].items())
+        failed = f", {stats['failed_batches']} failed" if stats['failed_batches'] else ''
+        return (f"Inference broker: {stats['evals']} evals in {stats['batches']} batches "
+                f"(mean batch {stats['mean_batch_size']:.1f}{failed}), queue latency ms "
+                f"p50 {lat['p50']:.2f} p90 {lat['p90']:.2f} p99 {lat['p99']:.2f} max {lat['max']:.2f}\n"
+                f"  batch sizes: {hist}")
+
+class ThreadLocalEvaluator:
+    # predict() forwards to the InferenceClient bound to the calling thread.
+    # Lets objects that outlive a single thread (e.g. an MCTS tree kept
+    # between server requests) be used from any thread of a worker pool:
+    # pass bind as the pool's initializer.
+    def __init__(self, broker):
+        self.broker = broker
+        self.free_ids = queue.Queue()
+        for i in range(broker.num_actors):
+            self.free_ids.put(i)
+        self.local = threading.local()
+
+    def bind(self):
+        self.local.client = self.broker.client(self.free_ids.get_nowait())
+
+    def predict(self, boards):
+        return self.local.client.predict(boards)
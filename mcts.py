@@ -1,12 +1,53 @@
 import math
+import time
+from collections import OrderedDict
 import numpy as np
-import torch
+
+from profiling import profiler
+from tactics import WIN, LOSS, FORCED, make_solver
+
+class SearchBudget:
+    # When to stop one getActionProb call: after max_sims simulations, at a
+    # wall-clock deadline (a time.monotonic() value), or - when only the
+    # most visited move matters (temp == 0) - as soon as the runner-up can no
+    # longer catch up with the remaining simulations. `stop` is an optional
+    # threading.Event that ends the search as soon as it is set.
+    def __init__(self, max_sims, deadline=None, early_stop=False, stop=None):
+        self.max_sims = max_sims
+        self.deadline = deadline
+        self.early_stop = early_stop
+        self.stop = stop
+        self.started = time.monotonic()
+
+    def exhausted(self, sims, sims_run, root_counts):
+        # sims: simulations behind the root so far, sims_run: of those, run by this call
+        if sims >= self.max_sims or (self.stop is not None and self.stop.is_set()):
+            return True
+        if root_counts is None or not np.any(root_counts):
+            # Nothing to watch yet; always finish at least one visit below the root
+            return False
+
+        remaining = self.max_sims - sims
+        if self.deadline is not None:
+            now = time.monotonic()
+            if now >= self.deadline:
+                return True
+            if sims_run:
+                rate = sims_run / max(now - self.started, 1e-9)
+                remaining = min(remaining, rate * (self.deadline - now))
+
+        if self.early_stop and len(root_counts) > 1:
+            second, best = np.partition(root_counts, -2)[-2:]
+            return best - second > remaining
+        return False
 
 class MCTS:
     def __init__(self, game, nnet, args):
         self.game = game
         self.nnet = nnet
         self.args = args
+        self.solver = make_solver(game, args)
+        self.move_radius = getattr(args, 'move_radius', 0)
         
         self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
         self.Nsa = {}  # stores #times edge s,a was visited
@@ -14,18 +55,27 @@ class MCTS:
         self.Es = {}   # stores game.getGameEnded ended for board s
         self.Vs = {}   # stores valid moves for board s
 
-    def getActionProb(self, canonicalBoard, temp=1):
-        for i in range(self.args.numMCTSSims):
-            # Debug logging to see if it hangs
-            if i % 200 == 0:
-                 pass 
-                 # print(f"MCTS Sim {i}/{self.args.numMCTSSims}") 
-                 # Commented out to avoid spam, but useful for debugging if needed.
-                 # User reports hanging, so let's enable it briefly or just check for hangs.
-            
+    def getActionProb(self, canonicalBoard, temp=1, deadline=None, max_sims=None, stop=None):
+        # deadline: optional time.monotonic() value to stop at; max_sims
+        # defaults to args.numMCTSSims; stop: see SearchBudget.
+        # self.sims_run reports what was run.
+        budget = SearchBudget(self.args.numMCTSSims if max_sims is None else max_sims, deadline,
+                              early_stop=(temp == 0), stop=stop)
+        s = self.game.string_representation(canonicalBoard)
+        watch = deadline is not None or temp == 0
+
+        self.sims_run = 0
+        while True:
+            counts = np.array([self.Nsa.get((s, a), 0) for a in range(self.game.get_action_size())]) if watch else None
+            if budget.exhausted(self.sims_run, self.sims_run, counts):
+                break
             self.search(canonicalBoard)
+            self.sims_run += 1
 
         s = self.game.string_representation(canonicalBoard)
+        self.root_s = s
+        profiler.count('mcts.sims', self.sims_run)
+        profiler.gauge('mcts.tree_nodes', len(self.Ys))
         counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.get_action_size())]
 
         if temp == 0:
@@ -46,54 +96,64 @@ class MCTS:
         probs = [x / counts_sum for x in counts]
         return probs
 
-    def search(self, canonicalBoard):
+    def root_stats(self):
+        # (visit counts per action, mean value for the player to move) at the
+        # root of the last getActionProb call
+        s = self.root_s
+        counts = np.array([self.Nsa.get((s, a), 0) for a in range(self.game.get_action_size())], dtype=np.float64)
+        total = counts.sum()
+        value = sum(self.Qsa[(s, a)] * n for a, n in enumerate(counts) if n) / total if total else 0.0
+        return counts, float(value)
+
+    def search(self, canonicalBoard, result=None, empty_count=None):
+        # result / empty_count are passed down by the parent so that a new
+        # node's terminal check only looks at the move that led to it
         s = self.game.string_representation(canonicalBoard)
 
         if s not in self.Es:
-            self.Es[s] = self.game.get_game_ended(canonicalBoard, 1)
+            if result is None:
+                result = self.game.get_game_ended(canonicalBoard, 1)
+            self.Es[s] = result
         if self.Es[s] != 0:
             # Terminal node
             return -self.Es[s]
 
+        clock = profiler.clock()
         if s not in self.Ys:
             # Leaf node
-            self.Vs[s] = self.game.get_valid_moves(canonicalBoard)
-            
-            # --- TACTICAL CHECK: Look for immediate wins ---
-            # If we can win immediately, force the policy to take that move 
-            # and return a winning value without consulting the NN.
-            winning_move = -1
-            for a in range(self.game.get_action_size()):
-                if self.Vs[s][a]:
-                    next_s, _ = self.game.get_next_state(canonicalBoard, 1, a)
-                    if self.game.check_win(next_s, 1):
-                        winning_move = a
-                        break
+            # Valid moves, restricted to the neighbourhood of the stones with args.move_radius
+            self.Vs[s] = self.game.candidate_moves(canonicalBoard, self.move_radius).astype(np.float64)
+            clock.lap('mcts.expand')
             
-            if winning_move != -1:
-                # Found a win!
-                # 1. Force Prior Probability (Ys) to 100% for this move
+            # --- TACTICAL CHECK ---
+            # Positions the threat solver decides (a forced win, or two
+            # opponent fives that cannot both be blocked) get their value
+            # without consulting the NN; a single opponent five leaves the
+            # block as the only valid move.
+            status, squares = self.solver.analyze(canonicalBoard)
+            clock.lap('mcts.tactics')
+            if status is not None:
+                profiler.count('tactics.' + status)
+            if status == WIN:
+                # Force Prior Probability (Ys) to 100% for the first move of the win
                 self.Ys[s] = np.zeros(self.game.get_action_size())
-                self.Ys[s][winning_move] = 1.0
-                
-                # 2. Return -1 (Value for parent is negative because we won)
-                # We skip the NN entirely.
+                self.Ys[s][squares[0]] = 1.0
+                self.Vs[s][squares[0]] = 1
+                # Value for parent is negative because we win
                 return -1
+            if status == LOSS:
+                self.Vs[s] = np.zeros(self.game.get_action_size())
+                self.Vs[s][squares] = 1
+                self.Ys[s] = self.Vs[s] / len(squares)
+                return 1
+            if status == FORCED:
+                self.Vs[s] = np.zeros(self.game.get_action_size())
+                self.Vs[s][squares] = 1
 
             # Predict with Neural Net
-            board_tensor = torch.FloatTensor(canonicalBoard.astype(np.float64))
-            
-            # Use device from args
-            device = getattr(self.args, 'device', 'cpu')
-            if device != 'cpu':
-                board_tensor = board_tensor.contiguous().to(device)
-            
-            # Put in batch form
-            self.nnet.eval()
-            with torch.no_grad():
-                pi, v = self.nnet(board_tensor)
-
-            self.Ys[s] = torch.exp(pi).data.cpu().numpy()[0]
+            probs, values = self.nnet.predict(canonicalBoard[np.newaxis])
+            clock.lap('mcts.nn_eval')
+            self.Ys[s] = probs[0]
             
             # Mask invalid moves
             self.Ys[s] = self.Ys[s] * self.Vs[s]
@@ -104,8 +164,9 @@ class MCTS:
                 # All valid moves were masked, uniform distribution
                 self.Ys[s] = self.Ys[s] + self.Vs[s]
                 self.Ys[s] /= np.sum(self.Ys[s])
+            clock.lap('mcts.expand')
 
-            return -v.data.cpu().numpy()[0]
+            return -values[0]
 
         # Upper Confidence Bound (UCB)
         vals = []
@@ -127,15 +188,583 @@ class MCTS:
                     best_act = a
 
         a = best_act
-        next_s, next_player = self.game.get_next_state(canonicalBoard, 1, a)
+        if empty_count is None:
+            empty_count = self.game.count_empty(canonicalBoard)
+        next_s, next_player, next_result = self.game.get_next_state_with_result(canonicalBoard, 1, a, empty_count)
         next_s = self.game.get_canonical_form(next_s, next_player)
+        clock.lap('mcts.select')
 
-        v = self.search(next_s)
+        v = self.search(next_s, next_result, empty_count - 1)
 
+        clock = profiler.clock()
         if (s, a) in self.Qsa:
             self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
             self.Nsa[(s, a)] += 1
         else:
             self.Qsa[(s, a)] = v
             self.Nsa[(s, a)] = 1
+        clock.lap('mcts.backup')
         return -v
+
+
+class ArrayMCTS:
+    # Same interface as MCTS, but the tree lives in preallocated NumPy arrays:
+    # one row per node, one column per action. Every node keeps its own visit
+    # total, so PUCT is a single vectorized argmax over the action dimension
+    # instead of a Python loop that sums the visit counts of the whole tree.
+    #
+    # With args.mcts_batch_size = K > 1 each round descends K times, marking
+    # the paths with virtual loss so the descents spread over different
+    # leaves, then evaluates all new leaves in one forward pass.
+    #
+    # Nodes are also entered in a transposition table keyed by the 64-bit
+    # Zobrist hash of their canonical position, so a position reached by
+    # different move orders is one node whose statistics all paths share
+    # (the tree is really a DAG). Once args.mcts_memory_mb worth of nodes is
+    # in use, the least visited half is evicted before the next round.
+    #
+    # The tree is kept between getActionProb calls: if the new board is
+    # already a node (the old root or a position below it), that subtree
+    # becomes the new root and only the missing simulations are run
+    # (args.reuse_tree).
+    #
+    # gumbel_action is an alternative root search for self-play: Gumbel
+    # top-k sampling plus sequential halving at the root, PUCT below it.
+    NODE_ARRAYS = ('Nsa', 'Wsa', 'Ps', 'Vs', 'children', 'Ns', 'Es', 'expanded', 'pending', 'keys')
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.n = game.get_board_size()[0]
+        self.action_size = game.get_action_size()
+        self.batch_size = max(1, getattr(args, 'mcts_batch_size', 1))
+        self.virtual_loss = getattr(args, 'virtual_loss', 1.0)
+        self.solver = make_solver(game, args)
+        # Moves considered at a node: empty cells within move_radius of a stone (0 = all empty cells)
+        self.move_radius = getattr(args, 'move_radius', 0)
+
+        self.reuse_tree = getattr(args, 'reuse_tree', True)
+        self.initial_capacity = getattr(args, 'mcts_capacity', 1024)
+
+        # Canonical leaf boards are written straight into this NN input batch
+        self.leaf_boards = np.zeros((self.batch_size, self.n, self.n), dtype=np.float32)
+        # Scratch buffers for PUCT
+        self._q = np.zeros(self.action_size)
+        self._u = np.zeros(self.action_size)
+        self._masked = np.zeros(self.action_size)
+
+        # Root move every descent starts with (-1: chosen by PUCT), set by gumbel_action
+        self.forced_root = -1
+
+        self._allocate(self.initial_capacity)
+        # Node budget for args.mcts_memory_mb, from the bytes one node row takes
+        self.max_nodes = max(2, int(getattr(args, 'mcts_memory_mb', 512) * 2**20 * self.capacity // self.memory_bytes()))
+        self.reset()
+
+    def _allocate(self, capacity):
+        A = self.action_size
+        self.capacity = capacity
+        self.Nsa = np.zeros((capacity, A))                          # edge visit counts
+        self.Wsa = np.zeros((capacity, A))                          # summed edge values
+        self.Ps = np.zeros((capacity, A), dtype=np.float32)         # priors from the NN
+        self.Vs = np.zeros((capacity, A), dtype=bool)               # valid moves
+        self.children = np.full((capacity, A), -1, dtype=np.int32)  # child node per edge
+        self.Ns = np.zeros(capacity)                                # visit total per node
+        self.Es = np.zeros(capacity, dtype=np.float32)              # game result, 0 if not ended
+        self.expanded = np.zeros(capacity, dtype=bool)
+        self.pending = np.zeros(capacity, dtype=bool)               # waiting for NN evaluation
+        self.keys = np.zeros(capacity, dtype=np.uint64)             # Zobrist hash of the canonical position
+
+    def _grow(self):
+        old = [getattr(self, name) for name in self.NODE_ARRAYS]
+        self._allocate(self.capacity * 2)
+        for name, src in zip(self.NODE_ARRAYS, old):
+            getattr(self, name)[:len(src)] = src
+
+    def reset(self):
+        for name in self.NODE_ARRAYS:
+            getattr(self, name)[:] = -1 if name == 'children' else 0
+        self.size = 0
+        self.root = -1
+        self.table = {}  # Zobrist hash -> node
+        self.free = []   # evicted node rows available for reuse
+
+    def memory_bytes(self):
+        return sum(getattr(self, name).nbytes for name in self.NODE_ARRAYS)
+
+    def _new_node(self, result, key):
+        if self.free:
+            node = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            node = self.size
+            self.size += 1
+        self.Es[node] = result
+        self.keys[node] = key
+        self.table[key] = node
+        return node
+
+    def _evict(self):
+        # Drops the least visited half of the nodes (never the root). Edge
+        # statistics live in the parent's row, so a parent keeps its N/W for
+        # the edge and only loses the child's own subtree statistics.
+        live = np.setdiff1d(np.arange(self.size), self.free + [self.root])
+        victims = live[np.argsort(self.Ns[live], kind='stable')[:len(live) // 2]]
+
+        evicted = np.zeros(self.size + 1, dtype=bool)  # index -1 (no child) stays False
+        evicted[victims] = True
+        self.children[:self.size][evicted[self.children[:self.size]]] = -1
+        for node in victims:
+            del self.table[int(self.keys[node])]
+        for name in self.NODE_ARRAYS:
+            getattr(self, name)[victims] = -1 if name == 'children' else 0
+        self.free.extend(int(node) for node in victims)
+
+    def getActionProb(self, canonicalBoard, temp=1, deadline=None, max_sims=None, stop=None):
+        # deadline: optional time.monotonic() value to stop at; max_sims
+        # defaults to args.numMCTSSims; stop: see SearchBudget.
+        # self.sims_run reports what was run.
+        self._set_root(canonicalBoard)
+        budget = SearchBudget(self.args.numMCTSSims if max_sims is None else max_sims, deadline,
+                              early_stop=(temp == 0), stop=stop)
+
+        # A reused root already carries (visits + 1) simulations
+        sims = int(self.Ns[self.root]) + 1 if self.expanded[self.root] else 0
+        self.sims_run = 0
+        while not budget.exhausted(sims, self.sims_run, self.Nsa[self.root]):
+            sims += self._simulate(canonicalBoard, budget.max_sims - sims)
+        profiler.count('mcts.sims', self.sims_run)
+        profiler.gauge('mcts.tree_nodes', self.size - len(self.free))
+
+        counts = self.Nsa[self.root]
+
+        if temp == 0:
+            bestAs = np.flatnonzero(counts == np.max(counts))
+            bestA = np.random.choice(bestAs)
+            probs = np.zeros(self.action_size)
+            probs[bestA] = 1
+            return probs
+
+        counts = counts ** (1. / temp)
+        counts_sum = np.sum(counts)
+        if counts_sum == 0:
+            # Safety fallback: if no simulations were successful, pick a random valid move
+            valid_moves = self.game.get_valid_moves(canonicalBoard)
+            return valid_moves / np.sum(valid_moves)
+
+        return counts / counts_sum
+
+    def _simulate(self, canonicalBoard, k):
+        # One round of up to k simulations; returns how many completed
+        if self.size - len(self.free) >= self.max_nodes:
+            self._evict()
+        if self.batch_size == 1:
+            self.search(canonicalBoard)
+            done = 1
+        else:
+            done = self.search_batch(canonicalBoard, min(self.batch_size, k))
+        self.sims_run += done
+        return done
+
+    def gumbel_action(self, canonicalBoard, sims, max_considered=16, c_visit=50.0, c_scale=1.0):
+        # Root search of Gumbel AlphaZero (Danihelka et al., "Policy
+        # improvement by planning with Gumbel", 2022). Returns (action,
+        # improved policy) after about `sims` simulations:
+        #   - m = max_considered moves are drawn without replacement by
+        #     Gumbel top-k on the root priors (g + log P)
+        #   - sequential halving: the budget is split over log2(m) phases,
+        #     each phase gives its candidates equal visits (descents start
+        #     with the candidate, PUCT below), then keeps the better half
+        #     by g + log P + sigma(Q)
+        #   - the action is the last candidate standing; the policy target
+        #     is softmax(log P + sigma(completed Q)), where unvisited moves
+        #     get the prior-weighted mean Q of the visited ones
+        # sigma(q) = (c_visit + max N) * c_scale * q, with Q mapped to [0, 1].
+        # The sampled action is already exploratory, so no temperature.
+        self._set_root(canonicalBoard)
+        self.sims_run = 0
+        root = self.root
+        while not self.expanded[root] and self.Es[root] == 0:
+            self._simulate(canonicalBoard, 1) # the first simulation expands the root
+
+        prior = self.Ps[root].astype(np.float64)
+        moves = np.flatnonzero(prior > 0) # tactics may leave valid moves without prior
+        if len(moves) == 1:
+            policy = np.zeros(self.action_size)
+            policy[moves[0]] = 1.0
+            return int(moves[0]), policy
+        logits = np.full(self.action_size, -np.inf)
+        logits[moves] = np.log(prior[moves])
+        g = np.random.gumbel(size=self.action_size)
+
+        def sigma(q):
+            return (c_visit + self.Nsa[root].max()) * c_scale * (q + 1) / 2
+
+        def q_of(actions):
+            N = self.Nsa[root, actions]
+            return np.where(N > 0, self.Wsa[root, actions] / np.maximum(N, 1), -1.0)
+
+        # Every phase gives each candidate at least one visit, so m is the
+        # largest count with phases * m <= budget: the halving then never
+        # spends more than the budget (m <= n in the paper)
+        budget = sims - self.sims_run
+        m = min(max_considered, len(moves), budget)
+        while m > 2 and math.ceil(math.log2(m)) * m > budget:
+            m -= 1
+        considered = moves[np.argsort(-(g[moves] + logits[moves]), kind='stable')[:max(m, 1)]]
+        phases = math.ceil(math.log2(m)) if m > 1 else 0 # one candidate left: nothing to compare
+        start = self.Nsa[root].copy()
+        added = 0 # visits each remaining candidate has received so far
+        for phase in range(phases):
+            left = sims - self.sims_run
+            per = max(1, budget // (phases * len(considered)))
+            if phase == phases - 1:
+                per = max(per, left // len(considered))
+            added += per
+            for a in considered:
+                self.forced_root = int(a)
+                while self.Nsa[root, a] - start[a] < added:
+                    self._simulate(canonicalBoard, added - int(self.Nsa[root, a] - start[a]))
+            self.forced_root = -1
+            if len(considered) > 1:
+                score = g[considered] + logits[considered] + sigma(q_of(considered))
+                considered = considered[np.argsort(-score, kind='stable')[:math.ceil(len(considered) / 2)]]
+        profiler.count('mcts.sims', self.sims_run)
+        profiler.gauge('mcts.tree_nodes', self.size - len(self.free))
+
+        N = self.Nsa[root, moves]
+        q = q_of(moves)
+        visited = N > 0
+        v_mix = (prior[moves][visited] @ q[visited]) / prior[moves][visited].sum() if visited.any() else 0.0
+        completed = np.where(visited, q, v_mix)
+        z = logits[moves] + sigma(completed)
+        z = np.exp(z - z.max())
+        policy = np.zeros(self.action_size)
+        policy[moves] = z / z.sum()
+        return int(considered[0]), policy
+
+    def root_stats(self):
+        # (visit counts per action, mean value for the player to move) at the
+        # root of the last getActionProb call
+        counts = self.Nsa[self.root].copy()
+        total = counts.sum()
+        return counts, float(self.Wsa[self.root].sum() / total) if total else 0.0
+
+    def _set_root(self, canonicalBoard):
+        key = self.game.hash_board(canonicalBoard)
+        node = self.table.get(key, -1) if self.reuse_tree else -1
+        if node == -1:
+            self.reset()
+            node = self._new_node(self.game.get_game_ended(canonicalBoard, 1), key)
+        self._compact(node)
+        # The board every simulation walks down and back up (make/unmake),
+        # with its neighbour counts for candidate moves
+        self.board = canonicalBoard.astype(np.int8)
+        self.near = self.game.neighbor_counts(self.board, self.move_radius) if self.move_radius else None
+        self.root_empty = self.game.count_empty(canonicalBoard)
+        # Hashes of the root board seen by the root player and by the opponent
+        self.root_keys = (key, self.game.hash_board(-canonicalBoard))
+
+    def _compact(self, node):
+        # Make `node` the root and drop what is no longer reachable from it.
+        # If most of the tree survives, the dead rows are freed in place;
+        # otherwise the subtree is renumbered from 0 into arrays sized for
+        # it, so memory does not grow with discarded siblings
+        if node == self.root:
+            return
+        reached = np.zeros(self.size, dtype=bool)
+        reached[node] = True
+        levels = [np.array([node])]
+        while len(levels[-1]):
+            children = self.children[levels[-1]].ravel()
+            children = children[children != -1]
+            children = np.unique(children[~reached[children]])
+            reached[children] = True
+            levels.append(children)
+        order = np.concatenate(levels)
+
+        if 2 * len(order) >= self.size - len(self.free):
+            dead = np.flatnonzero(~reached)
+            was_free = np.zeros(self.size, dtype=bool)
+            was_free[self.free] = True
+            for key in self.keys[dead[~was_free[dead]]]:
+                del self.table[int(key)]
+            for name in self.NODE_ARRAYS:
+                getattr(self, name)[dead] = -1 if name == 'children' else 0
+            self.free = dead.tolist()
+            self.root = node
+            return
+
+        remap = np.full(self.size + 1, -1, dtype=np.int32)  # index -1 maps to -1
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        kept = [getattr(self, name)[order] for name in self.NODE_ARRAYS]
+
+        capacity = self.initial_capacity
+        while capacity < 2 * len(order):
+            capacity *= 2
+        self._allocate(capacity)
+        for name, src in zip(self.NODE_ARRAYS, kept):
+            getattr(self, name)[:len(src)] = src
+        self.children[:len(order)] = remap[kept[self.NODE_ARRAYS.index('children')]]
+        self.size = len(order)
+        self.root = 0
+        self.table = dict(zip(self.keys[:self.size].tolist(), range(self.size)))
+        self.free = []
+
+    def search(self, canonicalBoard):
+        # One simulation with a batch-1 NN evaluation at the leaf.
+        # canonicalBoard must be the board of the last getActionProb call.
+        clock = profiler.clock()
+        node, path, leaf_board = self._descend(0, self.leaf_boards[0])
+        clock.lap('mcts.select')
+
+        if self.Es[node] != 0:
+            # Terminal node
+            v = -self.Es[node]
+        else:
+            v = self._expand_tactical(node, leaf_board)
+            clock.lap('mcts.tactics')
+            if v is None:
+                probs, values = self.nnet.predict(self.leaf_boards[:1])
+                clock.lap('mcts.nn_eval')
+                self._set_priors(node, probs[0])
+                clock.lap('mcts.expand')
+                v = values[0]
+            v = -v
+
+        self._backup(path, v, 0)
+        clock.lap('mcts.backup')
+
+    def search_batch(self, canonicalBoard, k):
+        # Up to k simulations whose leaves share one NN call. Returns how many
+        # simulations completed; a descent that runs into a leaf already
+        # waiting for evaluation ends the round early.
+        vl = self.virtual_loss
+        done = 0
+        leaves = []
+        clock = profiler.clock()
+
+        for _ in range(k):
+            node, path, leaf_board = self._descend(vl, self.leaf_boards[len(leaves)])
+            clock.lap('mcts.select')
+
+            if self.Es[node] != 0:
+                self._backup(path, -self.Es[node], vl)
+                clock.lap('mcts.backup')
+                done += 1
+                continue
+            if self.pending[node]:
+                # Collision: undo this descent's virtual loss and evaluate what we have
+                self._backup(path, None, vl)
+                clock.lap('mcts.backup')
+                profiler.count('mcts.collisions')
+                break
+
+            v = self._expand_tactical(node, leaf_board)
+            clock.lap('mcts.tactics')
+            if v is not None:
+                self._backup(path, -v, vl)
+                clock.lap('mcts.backup')
+                done += 1
+            else:
+                self.pending[node] = True
+                leaves.append((node, path))
+
+        if leaves:
+            probs, values = self.nnet.predict(self.leaf_boards[:len(leaves)])
+            clock.lap('mcts.nn_eval')
+            for (node, path), p, v in zip(leaves, probs, values):
+                self.pending[node] = False
+                self._set_priors(node, p)
+                clock.lap('mcts.expand')
+                self._backup(path, -v, vl)
+                clock.lap('mcts.backup')
+            done += len(leaves)
+
+        return done
+
+    def _descend(self, vl, out):
+        # Walks from the root to a terminal or unexpanded node, adding virtual
+        # loss vl to every edge taken. Stones are placed on self.board in
+        # absolute colours and taken off again on the way out; `player` is the
+        # side to move, so the leaf's canonical form, `player * board`, is
+        # written into `out` (a row of the NN input batch) and returned.
+        # The valid moves of a new leaf are stored here too, while the
+        # neighbour counts describe it.
+        board = self.board
+        near = self.near
+        radius = self.move_radius
+        player = 1
+        node = self.root
+        path = []
+        h_root, h_opp = self.root_keys  # canonical hashes for either side to move
+
+        forced = self.forced_root
+        while self.Es[node] == 0 and self.expanded[node]:
+            if forced >= 0:
+                a, forced = forced, -1
+            else:
+                a = self._select(node)
+            path.append((node, a))
+            if vl:
+                self.Nsa[node, a] += vl
+                self.Wsa[node, a] -= vl
+                self.Ns[node] += vl
+            self.game.make_move(board, player, a)
+            if near is not None:
+                self.game.add_neighbors(near, a, radius)
+            h_root = self.game.update_hash(h_root, a, player)
+            h_opp = self.game.update_hash(h_opp, a, -player)
+            player = -player
+
+            child = self.children[node, a]
+            if child == -1:
+                key = h_root if player == 1 else h_opp
+                child = self.table.get(key, -1)
+                if child == -1:
+                    empty_count = self.root_empty - len(path)
+                    child = self._new_node(self.game.get_move_result(board, -player, a, empty_count), key)
+                self.children[node, a] = child
+            node = child
+
+        np.multiply(board, player, out=out)
+        if self.Es[node] == 0 and not self.expanded[node] and not self.pending[node]:
+            self.game.candidate_moves(board, radius, near, out=self.Vs[node])
+        for _, a in path:
+            self.game.unmake_move(board, a)
+            if near is not None:
+                self.game.remove_neighbors(near, a, radius)
+        return node, path, out
+
+    def _backup(self, path, v, vl):
+        # v is the value from the point of view of the player who moved into
+        # the leaf. v=None only removes the virtual loss.
+        for node, a in reversed(path):
+            if v is None:
+                self.Nsa[node, a] -= vl
+                self.Wsa[node, a] += vl
+                self.Ns[node] -= vl
+                continue
+            self.Wsa[node, a] += v + vl
+            self.Nsa[node, a] += 1 - vl
+            self.Ns[node] += 1 - vl
+            v = -v
+
+    def _select(self, node):
+        # PUCT in preallocated buffers: Q + cpuct * P * sqrt(Ns) / (1 + N).
+        # W is 0 wherever N is, so max(N, 1) gives Q = 0 for unvisited edges.
+        N = self.Nsa[node]
+        q = np.maximum(N, 1, out=self._q)
+        np.divide(self.Wsa[node], q, out=q)
+        u = np.add(N, 1, out=self._u)
+        np.divide(self.Ps[node], u, out=u)
+        u *= self.args.cpuct * math.sqrt(self.Ns[node] + 1e-8)
+        u += q
+        masked = self._masked
+        masked.fill(-np.inf)
+        np.copyto(masked, u, where=self.Vs[node])
+        return int(np.argmax(masked))
+
+    def _expand_tactical(self, node, canonicalBoard):
+        # Runs the tactical solver on a new leaf (its valid moves were stored
+        # by _descend). If tactics decide the position the node is expanded
+        # here and its value for the player to move is returned, so the
+        # caller can skip the NN: +1 for a forced win (its first move is the only
+        # prior), -1 when the opponent has two fives that cannot both be
+        # blocked. Otherwise returns None; a single opponent five still
+        # narrows the valid moves to the block before the NN sees the node.
+        valids = self.Vs[node]
+        status, squares = self.solver.analyze(canonicalBoard)
+        if status is not None:
+            profiler.count('tactics.' + status)
+        if status == WIN:
+            valids[squares[0]] = True # a four can start outside move_radius
+            self.Ps[node] = 0
+            self.Ps[node, squares[0]] = 1.0
+            self.expanded[node] = True
+            return 1.0
+        if status == LOSS or status == FORCED:
+            valids[:] = False
+            valids[squares] = True
+        if status == LOSS:
+            self.Ps[node] = valids / len(squares)
+            self.expanded[node] = True
+            return -1.0
+        return None
+
+    def _set_priors(self, node, probs):
+        valids = self.Vs[node]
+        ps = probs * valids
+        sum_ps = np.sum(ps)
+        if sum_ps > 0:
+            ps /= sum_ps
+        else:
+            # All valid moves were masked, uniform distribution
+            ps = valids / np.sum(valids)
+        self.Ps[node] = ps
+        self.expanded[node] = True
+
+
+class SymmetricEvalCache:
+    # Drop-in replacement for nnet.predict that memoizes evaluations under the
+    # 8 board symmetries, so a position and its rotations / mirror images
+    # share one NN call. Entries are keyed by GomokuGame.canonical_hash and
+    # store the policy in the canonical orientation; it is mapped back to the
+    # orientation of each board that looks it up. LRU, at most max_size entries.
+    def __init__(self, game, nnet, max_size=100000):
+        self.game = game
+        self.nnet = nnet
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def predict(self, boards):
+        perms = self.game.symmetry_perms
+        probs = np.empty((len(boards), self.game.get_action_size()), dtype=np.float32)
+        values = np.empty(len(boards), dtype=np.float32)
+        missing = {} # canonical key -> [(row, k), ...] of boards still to evaluate
+
+        for i, board in enumerate(boards):
+            key, k = self.game.canonical_hash(board)
+            entry = self.cache.get(key)
+            if entry is None:
+                missing.setdefault(key, []).append((i, k))
+                continue
+            self.cache.move_to_end(key)
+            probs[i] = entry[0][perms[k]]
+            values[i] = entry[1]
+            self.hits += 1
+            profiler.count('symmetry_cache.hits')
+
+        if missing:
+            # One NN row per distinct position; symmetric duplicates within the batch share it
+            rows = [ids[0][0] for ids in missing.values()]
+            new_probs, new_values = self.nnet.predict(np.asarray(boards)[rows])
+            for (key, ids), p, v in zip(missing.items(), new_probs, new_values):
+                canonical = np.empty_like(p)
+                canonical[perms[ids[0][1]]] = p
+                self.cache[key] = (canonical, v)
+                for i, k in ids:
+                    probs[i] = canonical[perms[k]]
+                    values[i] = v
+            self.misses += len(missing)
+            self.hits += sum(len(ids) - 1 for ids in missing.values())
+            profiler.count('symmetry_cache.misses', len(missing))
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+        return probs, values
+
+def make_mcts(game, nnet, args):
+    # args.mcts_backend picks the tree implementation: 'dict' (MCTS) or 'array' (ArrayMCTS)
+    backend = getattr(args, 'mcts_backend', 'dict')
+    if getattr(args, 'symmetry_cache', False):
+        nnet = SymmetricEvalCache(game, nnet, getattr(args, 'symmetry_cache_size', 100000))
+    if backend == 'array':
+        return ArrayMCTS(game, nnet, args)
+    if backend == 'dict':
+        return MCTS(game, nnet, args)
+    raise ValueError(f"Unknown MCTS backend: {backend}")
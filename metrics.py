@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+
+# --- Training metrics ---
+# An append-only JSON Lines file (checkpoint/metrics.jsonl): one record per
+# line, written and flushed as soon as it is known, so the cost of a write
+# does not grow with the length of the run. A last line cut off by a crash
+# is dropped when the file is opened again. Records carry a 'kind':
+#   epoch     iteration, epoch, pi_loss, v_loss, samples_per_sec, timestamp
+#   selfplay  iteration, episodes, examples, sims, evals, seconds,
+#             sims_per_sec, evals_per_sec, examples_per_sec, timestamp
+#   profile   iteration, seconds, timers, counters, gauges, timestamp
+#             (with args.profile, see profiling.py)
+# A run resumes from the last epoch record, found by reading the file
+# backwards from its end. Plots are rendered from the file on demand (or by
+# a background process the trainer starts once per iteration):
+#
+#   python metrics.py --checkpoint checkpoint/
+
+class MetricsLog:
+    def __init__(self, path, legacy_path=None):
+        # legacy_path: a training_log.json ({'history': [...]}) whose epochs
+        # are copied into a new metrics file; the JSON file is left as it is
+        self.path = path
+        if not os.path.exists(path) and legacy_path is not None and os.path.exists(legacy_path):
+            migrate(legacy_path, path)
+        drop_partial_line(path)
+        self.file = open(path, 'a')
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def migrate(legacy_path, path):
+    try:
+        with open(legacy_path, 'r') as f:
+            history = json.load(f)['history']
+    except Exception as e:
+        print(f"Error loading log file: {e}. Starting fresh metrics.")
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        for entry in history:
+            f.write(json.dumps({'kind': 'epoch', **entry}) + '\n')
+    os.replace(tmp, path)
+    print(f"Migrated {len(history)} epochs from {legacy_path} to {path}")
+
+def drop_partial_line(path, block_size=4096):
+    # Truncates a last line cut off by a crash mid-write, so that the next
+    # record starts on a line of its own instead of being glued onto it
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = size = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            print(f"Dropped {size - end} bytes of an incomplete last record from {path}")
+
+def last_record(path, kind, block_size=4096):
+    # Last record of `kind`, reading the file backwards from its end
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        partial = b''
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            lines = (f.read(end - start) + partial).split(b'\n')
+            end = start
+            # The first line may begin in the block before this one
+            partial = lines.pop(0) if end > 0 else b''
+            for line in reversed(lines):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # empty, or cut off by a crash mid-write
+                if record.get('kind') == kind:
+                    return record
+    return None
+
+def read_metrics(path):
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+def save_plots(path, out):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    records = read_metrics(path)
+    epochs = [r for r in records if r.get('kind') == 'epoch']
+    selfplay = [r for r in records if r.get('kind') == 'selfplay']
+
+    plt.figure(figsize=(18, 5))
+
+    # Policy Loss
+    plt.subplot(1, 3, 1)
+    plt.plot([r['pi_loss'] for r in epochs], label='Policy Loss', color='blue')
+    plt.title('Policy Loss over Epochs')
+    plt.xlabel('Epochs')
+    plt.ylabel('Loss')
+    plt.legend()
+    plt.grid(True)
+
+    # Value Loss
+    plt.subplot(1, 3, 2)
+    plt.plot([r['v_loss'] for r in epochs], label='Value Loss', color='red')
+    plt.title('Value Loss over Epochs')
+    plt.xlabel('Epochs')
+    plt.ylabel('Loss')
+    plt.legend()
+    plt.grid(True)
+
+    # Self-play throughput
+    plt.subplot(1, 3, 3)
+    iterations = [r['iteration'] for r in selfplay]
+    plt.plot(iterations, [r['sims_per_sec'] for r in selfplay], label='Sims/sec', color='green')
+    plt.plot(iterations, [r['evals_per_sec'] for r in selfplay], label='NN evals/sec', color='orange')
+    plt.title('Self-play Throughput')
+    plt.xlabel('Iteration')
+    plt.ylabel('Per second')
+    plt.legend()
+    plt.grid(True)
+
+    plt.tight_layout()
+    plt.savefig(out)
+    plt.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', default='checkpoint/')
+    parser.add_argument('--out', default=None, help="defaults to training_metrics.png in the checkpoint folder")
+    opts = parser.parse_args()
+    path = os.path.join(opts.checkpoint, 'metrics.jsonl')
+    if not os.path.exists(path):
+        MetricsLog(path, os.path.join(opts.checkpoint, 'training_log.json')).close()
+    save_plots(path, opts.out or os.path.join(opts.checkpoint, 'training_metrics.png'))
+
+if __name__ == "__main__":
+    main()
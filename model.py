@@ -1,13 +1,59 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import os
 
-class GomokuNet(nn.Module):
+from profiling import profiler
+
+class GomokuModel(nn.Module):
+    # Shared by the network variants: batch inference for MCTS and checkpoints.
+    # Subclasses implement forward(s) -> (log policy batch x n*n, value batch x 1)
+
+    def predict(self, boards):
+        # boards: numpy batch_size x board_x x board_y of canonical boards.
+        # Runs one forward pass in eval mode and returns numpy
+        # (policy probabilities batch_size x action_size, values batch_size).
+        if self.training:
+            self.eval()
+        clock = profiler.clock()
+        device = next(self.parameters()).device
+        s = torch.from_numpy(np.ascontiguousarray(boards)).to(device=device, dtype=torch.float32)
+        clock.lap('nn.to_device')
+        with torch.no_grad():
+            pi, v = self(s)
+        clock.lap('nn.forward')
+        # On CUDA the forward pass runs asynchronously: the wait shows up in nn.to_host
+        probs, values = torch.exp(pi).cpu().numpy(), v.view(-1).cpu().numpy()
+        clock.lap('nn.to_host')
+        profiler.count('nn.positions', len(boards))
+        return probs, values
+
+    def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
+        filepath = os.path.join(folder, filename)
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        torch.save({
+            'state_dict': self.state_dict(),
+        }, filepath)
+
+    def load_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
+        filepath = os.path.join(folder, filename)
+        if not os.path.exists(filepath):
+            raise ValueError(f"No model in path {filepath}")
+        map_location = None if torch.cuda.is_available() else 'cpu'
+        checkpoint = torch.load(filepath, map_location=map_location)
+        self.load_state_dict(checkpoint['state_dict'])
+
+class GomokuNet(GomokuModel):
+    # The original network: 4 conv layers and fully connected heads, so it is
+    # tied to the board size it was built for
     def __init__(self, game, num_channels=64, dropout=0.3):
         super(GomokuNet, self).__init__()
         self.board_x, self.board_y = game.get_board_size()
         self.action_size = game.get_action_size()
+        self.num_channels = num_channels
+        self.dropout = dropout
 
         # Input: batch_size x 1 x board_x x board_y
         self.conv1 = nn.Conv2d(1, num_channels, 3, stride=1, padding=1)
@@ -41,28 +87,84 @@ class GomokuNet(nn.Module):
         s = F.relu(self.bn3(self.conv3(s)))
         s = F.relu(self.bn4(self.conv4(s)))
         
-        s = s.view(-1, 64 * self.board_x * self.board_y)
+        s = s.view(-1, self.num_channels * self.board_x * self.board_y)
 
-        s = F.dropout(F.relu(self.fc_bn1(self.fc1(s))), p=0.3, training=self.training)
-        s = F.dropout(F.relu(self.fc_bn2(self.fc2(s))), p=0.3, training=self.training)
+        s = F.dropout(F.relu(self.fc_bn1(self.fc1(s))), p=self.dropout, training=self.training)
+        s = F.dropout(F.relu(self.fc_bn2(self.fc2(s))), p=self.dropout, training=self.training)
 
         pi = self.fc3(s) # Policy
         v = self.fc4(s)  # Value
 
         return F.log_softmax(pi, dim=1), torch.tanh(v)
 
-    def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
-        filepath = os.path.join(folder, filename)
-        if not os.path.exists(folder):
-            os.mkdir(folder)
-        torch.save({
-            'state_dict': self.state_dict(),
-        }, filepath)
+# --- Residual, fully convolutional variant ---
+# A tower of residual blocks with 1x1-conv heads. No layer depends on the
+# board size (the value head averages over the board before its small
+# fully connected layers), so the same weights run on any n.
 
-    def load_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
-        filepath = os.path.join(folder, filename)
-        if not os.path.exists(filepath):
-            raise ValueError(f"No model in path {filepath}")
-        map_location = None if torch.cuda.is_available() else 'cpu'
-        checkpoint = torch.load(filepath, map_location=map_location)
-        self.load_state_dict(checkpoint['state_dict'])
+INPUT_PLANES = 3
+
+def board_planes(s):
+    # s: batch x n x n canonical boards (+1 = player to move). Returns float
+    # input planes batch x 3 x n x n: own stones, opponent stones and ones
+    # (marks the board area against the zero padding). MCTS evaluates bare
+    # boards, so there is no last-move plane.
+    s = s.float()
+    return torch.stack([(s == 1).float(), (s == -1).float(), torch.ones_like(s)], dim=1)
+
+class ResBlock(nn.Module):
+    def __init__(self, num_channels):
+        super(ResBlock, self).__init__()
+        self.conv1 = nn.Conv2d(num_channels, num_channels, 3, stride=1, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(num_channels)
+        self.conv2 = nn.Conv2d(num_channels, num_channels, 3, stride=1, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(num_channels)
+
+    def forward(self, s):
+        out = F.relu(self.bn1(self.conv1(s)))
+        out = self.bn2(self.conv2(out))
+        return F.relu(out + s)
+
+class ResGomokuNet(GomokuModel):
+    def __init__(self, num_channels=64, num_blocks=6, value_channels=32):
+        super(ResGomokuNet, self).__init__()
+        self.conv_in = nn.Conv2d(INPUT_PLANES, num_channels, 3, stride=1, padding=1, bias=False)
+        self.bn_in = nn.BatchNorm2d(num_channels)
+        self.blocks = nn.Sequential(*[ResBlock(num_channels) for _ in range(num_blocks)])
+
+        # Policy Head: one logit per cell
+        self.pi_conv = nn.Conv2d(num_channels, 2, 1, bias=False)
+        self.pi_bn = nn.BatchNorm2d(2)
+        self.pi_out = nn.Conv2d(2, 1, 1)
+
+        # Value Head: 1x1 conv, average over the board, small MLP
+        self.v_conv = nn.Conv2d(num_channels, value_channels, 1, bias=False)
+        self.v_bn = nn.BatchNorm2d(value_channels)
+        self.v_fc1 = nn.Linear(value_channels, 64)
+        self.v_fc2 = nn.Linear(64, 1)
+
+    def forward(self, s):
+        # s: batch x n x n canonical boards, or batch x 3 x n x n planes
+        # already built with board_planes
+        if s.dim() == 3:
+            s = board_planes(s)
+
+        s = F.relu(self.bn_in(self.conv_in(s)))
+        s = self.blocks(s)
+
+        pi = self.pi_out(F.relu(self.pi_bn(self.pi_conv(s)))).flatten(1)
+
+        v = F.relu(self.v_bn(self.v_conv(s))).mean(dim=(2, 3))
+        v = self.v_fc2(F.relu(self.v_fc1(v)))
+
+        return F.log_softmax(pi, dim=1), torch.tanh(v)
+
+def make_model(game, args):
+    # args.model_arch picks the network: 'conv' (GomokuNet) or 'resnet' (ResGomokuNet)
+    arch = getattr(args, 'model_arch', 'conv')
+    num_channels = getattr(args, 'num_channels', 64)
+    if arch == 'resnet':
+        return ResGomokuNet(num_channels, getattr(args, 'num_res_blocks', 6))
+    if arch == 'conv':
+        return GomokuNet(game, num_channels, getattr(args, 'dropout', 0.3))
+    raise ValueError(f"Unknown model architecture: {arch}")
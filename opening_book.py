@@ -0,0 +1,177 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from game import GomokuGame
+from mcts import make_mcts
+from model import make_model
+
+# --- Position cache / opening book ---
+# Finished searches keyed by GomokuGame.canonical_hash, so a position and
+# its 7 rotations / mirror images share one entry. An entry holds the root
+# visit counts (stored in the canonical orientation and mapped back to the
+# orientation of each board that looks it up), the root value for the
+# player to move, the number of simulations behind them and whether the
+# search was settled: a temp=0 search that stopped early because its best
+# move could no longer be overtaken. A settled entry answers a request for
+# the move only (get(accept_settled=True)), not one for the full counts.
+# Settled entries stay in memory; SQLite only holds full searches.
+#
+# Entries live in an in-memory LRU; with a path they are also read from -
+# and, for put(persist=True), written to - a SQLite file. The opening book
+# is such a file precomputed offline from best.pth.tar:
+#
+#   python opening_book.py --checkpoint checkpoint/best.pth.tar --out checkpoint/opening_book.sqlite --depth 4
+#
+# and served with OPENING_BOOK=checkpoint/opening_book.sqlite python server.py.
+
+def _signed(key):
+    # SQLite integers are signed 64-bit
+    return key - 2**64 if key >= 2**63 else key
+
+class PositionCache:
+    def __init__(self, game, max_size=10000, path=None):
+        self.game = game
+        self.max_size = max_size
+        self.entries = OrderedDict() # canonical key -> (counts, value, sims, settled)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS positions "
+                            "(key INTEGER PRIMARY KEY, counts BLOB, value REAL, sims INTEGER)")
+            row = self.db.execute("SELECT value FROM meta WHERE name = 'n'").fetchone()
+            if row is None:
+                self.db.execute("INSERT INTO meta VALUES ('n', ?)", (str(game.n),))
+                self.db.commit()
+            elif int(row[0]) != game.n:
+                raise ValueError(f"{path} holds {row[0]}x{row[0]} positions, not {game.n}x{game.n}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, board, min_sims=0, accept_settled=False):
+        # (counts, value, sims) for a canonical board, or None if the
+        # position is unknown or was searched with fewer than min_sims
+        # (and, with accept_settled, was not settled either)
+        key, k = self.game.canonical_hash(board)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            elif self.db is not None:
+                row = self.db.execute("SELECT counts, value, sims FROM positions WHERE key = ?",
+                                      (_signed(key),)).fetchone()
+                if row is not None:
+                    entry = (np.frombuffer(row[0], dtype=np.float32), row[1], row[2], False)
+                    self._remember(key, entry)
+            if entry is None or (entry[2] < min_sims and not (accept_settled and entry[3])):
+                self.misses += 1
+                return None
+            self.hits += 1
+        counts, value, sims, _ = entry
+        return counts[self.game.symmetry_perms[k]], value, sims
+
+    def put(self, board, counts, value, sims, persist=False, settled=False):
+        # Keeps whichever of the stored and the new search has more simulations
+        key, k = self.game.canonical_hash(board)
+        canonical = np.empty(len(counts), dtype=np.float32)
+        canonical[self.game.symmetry_perms[k]] = counts
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > sims:
+                return
+            entry = (canonical, float(value), int(sims), bool(settled))
+            self._remember(key, entry)
+            if persist and not settled and self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?)",
+                                (_signed(key), canonical.tobytes(), entry[1], entry[2]))
+
+    def commit(self):
+        if self.db is not None:
+            with self.lock:
+                self.db.commit()
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+# --- Offline book builder ---
+
+def build_book(game, nnet, args, cache, depth, width, sims):
+    # Searches every position reached from the empty board by following, at
+    # each ply, the `width` most visited moves of the previous search, down
+    # to `depth` plies; symmetric duplicates are searched once
+    frontier = [game.get_init_board()]
+    seen = set()
+    for ply in range(depth + 1):
+        start = time.time()
+        next_frontier = []
+        for board in frontier:
+            key, _ = game.canonical_hash(board)
+            if key in seen:
+                continue
+            seen.add(key)
+            mcts = make_mcts(game, nnet, args)
+            mcts.getActionProb(board, temp=1, max_sims=sims)
+            counts, value = mcts.root_stats()
+            # The first simulation expands the root without visiting an edge
+            cache.put(board, counts, value, int(counts.sum()) + 1, persist=True)
+            if ply < depth:
+                for a in np.argsort(-counts, kind='stable')[:width]:
+                    if counts[a] == 0:
+                        break
+                    next_board, player, result = game.get_next_state_with_result(board, 1, int(a))
+                    if result == 0:
+                        # The opponent moves next: store its canonical view
+                        next_frontier.append(game.get_canonical_form(next_board, player))
+        cache.commit()
+        print(f"Ply {ply}: {len(seen)} positions in book ({time.time() - start:.1f}s)")
+        frontier = next_frontier
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', default='checkpoint/best.pth.tar')
+    parser.add_argument('--out', default='checkpoint/opening_book.sqlite')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--model-arch', default='conv')
+    parser.add_argument('--num-channels', type=int, default=64)
+    parser.add_argument('--num-res-blocks', type=int, default=6)
+    parser.add_argument('--depth', type=int, default=4, help="plies from the empty board")
+    parser.add_argument('--width', type=int, default=3, help="most visited moves followed at each position")
+    parser.add_argument('--sims', type=int, default=1600, help="MCTS simulations per book position")
+    opts = parser.parse_args()
+
+    class Args:
+        model_arch = opts.model_arch
+        num_channels = opts.num_channels
+        num_res_blocks = opts.num_res_blocks
+        numMCTSSims = opts.sims
+        cpuct = 1.0
+        mcts_backend = 'array'
+        mcts_batch_size = 8
+        tactics = True
+        move_radius = 2
+
+    game = GomokuGame(n=opts.board_size)
+    nnet = make_model(game, Args)
+    nnet.load_checkpoint(*os.path.split(opts.checkpoint))
+    nnet.eval()
+
+    cache = PositionCache(game, max_size=0, path=opts.out)
+    build_book(game, nnet, Args, cache, opts.depth, opts.width, opts.sims)
+    print(f"Wrote {opts.out}")
+
+if __name__ == "__main__":
+    main()
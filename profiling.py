@@ -0,0 +1,152 @@
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+# --- Instrumentation ---
+# Opt-in timers and counters for the hot paths (MCTS phases, tactics, NN
+# evaluation). Disabled, instrumented code pays one attribute check per
+# simulation: profiler.clock() returns a shared no-op clock. Enabled, each
+# phase is timed with perf_counter laps:
+#
+#   clock = profiler.clock()
+#   ... select ...
+#   clock.lap('mcts.select')   # time since the clock started / the last lap
+#
+# Turned on with enable() (train.py: args.profile, server.py: PROFILE=1).
+# Every process has its own `profiler`; self-play workers send snapshots
+# back with their episodes and the trainer merges them.
+
+class _Clock:
+    __slots__ = ('profiler', 'last')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.profiler.add(name, now - self.last)
+        self.last = now
+
+class _NullClock:
+    def lap(self, name):
+        pass
+
+_NULL_CLOCK = _NullClock()
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}   # name -> [calls, seconds]
+            self.counters = {} # name -> count
+            self.gauges = {}   # name -> last value
+            self.started = time.time()
+
+    def clock(self):
+        return _Clock(self) if self.enabled else _NULL_CLOCK
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            with self.lock:
+                self.gauges[name] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'seconds': time.time() - self.started,
+                'timers': {name: {'calls': calls, 'seconds': seconds, 'mean_us': seconds / calls * 1e6}
+                           for name, (calls, seconds) in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'gauges': dict(sorted(self.gauges.items())),
+            }
+
+    def merge(self, snapshot):
+        # Adds another process's snapshot to this profiler
+        with self.lock:
+            for name, t in snapshot['timers'].items():
+                timer = self.timers.setdefault(name, [0, 0.0])
+                timer[0] += t['calls']
+                timer[1] += t['seconds']
+            for name, n in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            self.gauges.update(snapshot['gauges'])
+
+    def format(self):
+        # Timers may nest (nn.forward runs inside mcts.nn_eval) and sum over
+        # threads and processes, so they are not shares of the wall time
+        snap = self.snapshot()
+        lines = [f"{'phase':<22} {'calls':>10} {'seconds':>9} {'mean us':>9}"]
+        for name, t in sorted(snap['timers'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{name:<22} {t['calls']:>10} {t['seconds']:>9.2f} {t['mean_us']:>9.1f}")
+        for name, value in list(snap['counters'].items()) + list(snap['gauges'].items()):
+            lines.append(f"{name:<22} {value:>10}")
+        return '\n'.join(lines)
+
+profiler = Profiler()
+
+def enable(on=True):
+    profiler.enabled = on
+
+# --- Sampling profiler ---
+# Samples the Python stacks of all threads of this process at a fixed
+# interval and counts them in the "folded" format (frames separated by ';',
+# then the sample count) read by flamegraph.pl and speedscope. Runs in a
+# background thread, so it can be started in a live trainer or server:
+# with SIGUSR1 (install_signal_handler) or server.py's /profile endpoint.
+
+def sample_stacks(seconds, interval=0.005):
+    # Counter of folded stacks over `seconds`
+    samples = collections.Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            samples[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+def format_folded(samples):
+    return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+def dump_samples(path, seconds, interval=0.005):
+    with open(path, 'w') as f:
+        f.write(format_folded(sample_stacks(seconds, interval)))
+    print(f"Profile of {seconds}s written to {path}")
+
+def install_signal_handler(folder, seconds=10.0):
+    # kill -USR1 <pid> writes a sampled profile of the next `seconds` to
+    # folder/profile-<pid>-<time>.folded (no-op where SIGUSR1 does not exist)
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    def handler(signum, frame):
+        path = os.path.join(folder, f"profile-{os.getpid()}-{int(time.time())}.folded")
+        threading.Thread(target=dump_samples, args=(path, seconds), daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, handler)
@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+
+# --- Replay buffer ---
+# Fixed-capacity ring of (canonical board, policy, value) training examples.
+# The arrays are preallocated .npy files memory-mapped from the checkpoint
+# folder, so the buffer survives restarts and only the pages in use stay
+# resident. Each slot also records the self-play iteration it came from,
+# which lets the trainer sample from a window of recent iterations.
+#
+# replay_meta.json holds the write position and is rewritten (atomically)
+# after the data of every append has been flushed. A buffer that cannot be
+# reopened (other board size or capacity, unreadable meta) is set aside:
+# its files are renamed to *.old and a fresh buffer is started.
+
+class ReplayBuffer:
+    def __init__(self, folder, n, capacity):
+        self.folder = folder
+        self.n = n
+        self.capacity = capacity
+        self.meta_file = os.path.join(folder, 'replay_meta.json')
+        os.makedirs(folder, exist_ok=True)
+
+        meta = None
+        if os.path.exists(self.meta_file):
+            try:
+                with open(self.meta_file, 'r') as f:
+                    meta = json.load(f)
+                if meta['n'] != n or meta['capacity'] != capacity:
+                    print(f"Replay buffer in {folder} is for n={meta['n']}, capacity={meta['capacity']}. Starting a fresh buffer.")
+                    meta = None
+            except Exception as e:
+                print(f"Error loading replay buffer: {e}. Starting a fresh buffer.")
+                meta = None
+            if meta is None:
+                self._set_aside()
+
+        mode = 'r+' if meta else 'w+'
+        self.boards = self._open('replay_boards.npy', mode, np.int8, (capacity, n, n))
+        self.pis = self._open('replay_pis.npy', mode, np.float32, (capacity, n * n))
+        self.vs = self._open('replay_vs.npy', mode, np.float32, (capacity,))
+        self.iters = self._open('replay_iters.npy', mode, np.int32, (capacity,))
+
+        if meta:
+            self.head, self.size = meta['head'], meta['size']
+            print(f"Loaded replay buffer with {self.size} examples.")
+        else:
+            self.iters[:] = -1
+            self.head, self.size = 0, 0
+            self._save_meta()
+
+    FILES = ('replay_boards.npy', 'replay_pis.npy', 'replay_vs.npy', 'replay_iters.npy', 'replay_meta.json')
+
+    def _set_aside(self):
+        # Keeps the old buffer's files as *.old (replacing an earlier set-aside buffer)
+        for name in self.FILES:
+            path = os.path.join(self.folder, name)
+            if os.path.exists(path):
+                os.replace(path, path + '.old')
+        print(f"Old replay buffer files in {self.folder} renamed to *.old")
+
+    def _open(self, name, mode, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(self.folder, name), mode=mode, dtype=dtype, shape=shape)
+
+    def _save_meta(self):
+        tmp = self.meta_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'n': self.n, 'capacity': self.capacity, 'head': self.head, 'size': self.size}, f)
+        os.replace(tmp, self.meta_file)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, examples, iteration):
+        # Appends a list of (board, pi, v) tuples, overwriting the oldest slots when full
+        if not examples:
+            return
+        boards, pis, vs = zip(*examples[-self.capacity:])
+        slots = (self.head + np.arange(len(boards))) % self.capacity
+        self.boards[slots] = np.array(boards)
+        self.pis[slots] = np.array(pis)
+        self.vs[slots] = vs
+        self.iters[slots] = iteration
+        for array in (self.boards, self.pis, self.vs, self.iters):
+            array.flush()
+
+        self.head = int(slots[-1] + 1) % self.capacity
+        self.size = min(self.size + len(boards), self.capacity)
+        self._save_meta()
+
+    def recent(self, iteration, window):
+        # Slots holding examples from the `window` iterations up to and
+        # including `iteration`; unused slots (iteration -1) never match
+        iters = self.iters
+        return np.flatnonzero((iters >= 0) & (iters > iteration - window) & (iters <= iteration))
+
+    def gather(self, slots):
+        # Copies of the examples in `slots` as (boards, pis, vs) arrays
+        return self.boards[slots], self.pis[slots], self.vs[slots]
@@ -0,0 +1,164 @@
+import multiprocessing as mp
+import random
+import numpy as np
+import torch
+
+from export import export_bytes, inference_model, load_exported
+from inference import InferenceBroker
+from mcts import make_mcts
+from model import make_model
+import profiling
+from profiling import profiler
+
+class EvalCounter:
+    # predict() wrapper that counts the positions the network evaluates
+    def __init__(self, nnet):
+        self.nnet = nnet
+        self.evals = 0
+
+    def predict(self, boards):
+        self.evals += len(boards)
+        return self.nnet.predict(boards)
+
+def execute_episode(game, mcts, args, stats=None):
+    # Plays one self-play game with `mcts` and returns its training examples
+    # as (canonical board, policy, value) tuples. stats: optional dict whose
+    # 'sims' entry is increased by the simulations run.
+    #
+    # Playout-cap randomization (args.playout_cap_fraction < 1): only that
+    # share of the moves gets the full numMCTSSims search and becomes a
+    # training example; the others are played after a cheap fast_sims
+    # search and not recorded. With args.gumbel_root the moves are chosen
+    # by ArrayMCTS.gumbel_action and the targets are its improved policies.
+    full_share = getattr(args, 'playout_cap_fraction', 1.0)
+    fast_sims = getattr(args, 'fast_sims', 20)
+    gumbel = getattr(args, 'gumbel_root', False)
+    if gumbel and not hasattr(mcts, 'gumbel_action'):
+        raise ValueError("gumbel_root needs mcts_backend='array'")
+    train_examples = []
+    board = game.get_init_board()
+    cur_player = 1
+    episode_step = 0
+    empty_count = game.count_empty(board)
+
+    # --- RANDOM START (Data Augmentation) ---
+    # To prevent the AI from overfitting to one opening and to help it handle
+    # disadvantages (like playing second against a center start), we randomize
+    # the board state slightly at the beginning of 50% of games.
+    if random.random() < 0.5:
+        num_random_moves = random.randint(1, 2)
+        for _ in range(num_random_moves):
+            valid = game.get_valid_moves(board)
+            # Get indices of valid moves
+            valid_indices = np.where(valid == 1)[0]
+            if len(valid_indices) > 0:
+                a = np.random.choice(valid_indices)
+                board, cur_player = game.get_next_state(board, cur_player, a)
+                empty_count -= 1
+                episode_step += 1
+    # ---------------------------------------
+
+    while True:
+        episode_step += 1
+        canonical_board = game.get_canonical_form(board, cur_player)
+        temp = int(episode_step < args.tempThreshold)
+        full = full_share >= 1.0 or random.random() < full_share
+        sims = args.numMCTSSims if full else fast_sims
+
+        if gumbel:
+            action, pi = mcts.gumbel_action(canonical_board, sims, getattr(args, 'gumbel_max_considered', 16))
+        else:
+            pi = mcts.getActionProb(canonical_board, temp=temp, max_sims=sims)
+            action = np.random.choice(len(pi), p=pi)
+        if stats is not None:
+            stats['sims'] += mcts.sims_run
+
+        if full:
+            # Stored once; the trainer's sampler applies a random one of the 8
+            # symmetries each time the example is drawn (args.augment_symmetries)
+            train_examples.append([canonical_board, cur_player, pi, None])
+
+        board, cur_player, r = game.get_next_state_with_result(board, cur_player, action, empty_count)
+        empty_count -= 1
+
+        if r != 0:
+            return [(x[0], x[2], r * ((-1) ** (x[1] != cur_player))) for x in train_examples]
+
+# --- Parallel self-play ---
+# Every worker process loads the trainer's current weights into its own CPU
+# GomokuNet once, then plays whole episodes. With args.inference_broker the
+# workers hold no network at all: their MCTS sends leaves to one
+# InferenceBroker in the trainer process, which batches them across workers
+# and runs the trainer's own nnet (on args.device).
+# With args.export_inference the network is first exported (BatchNorm
+# folded, optionally int8-quantized, TorchScript; see export.py) and the
+# workers or the broker run that artifact instead.
+#
+# Each episode reseeds the worker's RNGs from its own seed, so a run is
+# reproducible for a fixed args.seed no matter which worker picks up which
+# episode.
+
+_worker = {}
+
+def _init_worker(game, state_dict, args, clients=None, actor_ids=None, exported=None):
+    # One intra-op thread per worker: the parallelism comes from the processes
+    torch.set_num_threads(1)
+    if clients is not None:
+        nnet = clients[actor_ids.get()]
+    elif exported is not None:
+        nnet = load_exported(exported)
+    else:
+        nnet = make_model(game, args)
+        nnet.load_state_dict(state_dict)
+        nnet.eval()
+    _worker['game'] = game
+    _worker['nnet'] = nnet
+    _worker['args'] = args
+    if getattr(args, 'profile', False):
+        profiling.enable()
+
+def _play_episode(seed):
+    seed = int(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    game, args = _worker['game'], _worker['args']
+    nnet = EvalCounter(_worker['nnet'])
+    stats = {'sims': 0}
+    examples = execute_episode(game, make_mcts(game, nnet, args), args, stats)
+    stats['evals'] = nnet.evals
+    if profiler.enabled:
+        # The worker's timers for this episode, merged by the trainer
+        stats['profile'] = profiler.snapshot()
+        profiler.reset()
+    return examples, stats
+
+def parallel_self_play(game, nnet, args, num_eps, iteration=0):
+    # Yields (examples, stats) for each of num_eps episodes as soon as it
+    # finishes; stats holds the episode's MCTS simulations ('sims') and
+    # network evaluations ('evals')
+    seeds = np.random.SeedSequence(args.seed, spawn_key=(iteration,)).generate_state(num_eps)
+    ctx = mp.get_context(getattr(args, 'mp_start_method', None))
+
+    if not getattr(args, 'inference_broker', False):
+        if getattr(args, 'export_inference', False):
+            initargs = (game, None, args, None, None, export_bytes(nnet, game.n, getattr(args, 'quantize_inference', True)))
+        else:
+            initargs = (game, {k: v.detach().cpu() for k, v in nnet.state_dict().items()}, args)
+        with ctx.Pool(args.num_workers, initializer=_init_worker, initargs=initargs) as pool:
+            yield from pool.imap_unordered(_play_episode, seeds)
+        return
+
+    broker = InferenceBroker(inference_model(nnet, game, args), game.n, args.num_workers,
+                             max_leaves=max(1, getattr(args, 'mcts_batch_size', 1)),
+                             max_batch_size=getattr(args, 'broker_max_batch_size', 64),
+                             max_wait_ms=getattr(args, 'broker_max_wait_ms', 2.0),
+                             ctx=ctx)
+    actor_ids = ctx.Queue()
+    for i in range(args.num_workers):
+        actor_ids.put(i)
+    with broker:
+        with ctx.Pool(args.num_workers, initializer=_init_worker,
+                      initargs=(game, None, args, broker.clients(), actor_ids)) as pool:
+            yield from pool.imap_unordered(_play_episode, seeds)
+        print(broker.format_stats())
@@ -1,15 +1,41 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import threading
+import time
 import torch
 import numpy as np
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from game import GomokuGame
-from model import GomokuNet
-from mcts import MCTS
+from model import make_model
+from export import load_exported
+from mcts import make_mcts
+from opening_book import PositionCache
+from inference import InferenceBroker, ThreadLocalEvaluator
+import profiling
+from profiling import profiler
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Running searches end at their next simulation; the broker then fails
+    # whatever they still have queued, so no pool thread is left waiting
+    stopping.set()
+    search_pool.shutdown(wait=False, cancel_futures=True)
+    if ponder_pool is not None:
+        sessions.stop_pondering()
+        ponder_pool.shutdown(wait=False, cancel_futures=True)
+    broker.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,22 +49,25 @@ app.add_middleware(
 # WARNING: If you trained on n=8, you MUST change this to 8, or retrain the model on 15.
 # For the demo, I am setting this to 8 to match train.py default.
 # If your React app sends 15x15, this backend will error out unless you change this to 15 (and retrain).
-BOARD_SIZE = 8 
+# With MODEL_ARCH=resnet the weights are board-size agnostic, so a model
+# trained on one size can be served at another by setting BOARD_SIZE.
+BOARD_SIZE = int(os.environ.get('BOARD_SIZE', 8))
 
 game = GomokuGame(n=BOARD_SIZE)
-nnet = GomokuNet(game)
-
-# Try load model
-try:
-    nnet.load_checkpoint('checkpoint', 'best.pth.tar')
-    nnet.eval()
-    print("AI Model Loaded successfully")
-except:
-    print("WARNING: No trained model found. AI will play randomly/poorly.")
 
 class Args:
     numMCTSSims = 400 # Higher = smarter but slower (was 50)
+    maxTimedSims = 5000 # Simulation cap when the request gives a time budget (time_ms)
     cpuct = 1.0
+    mcts_backend = 'array' # 'array' (ArrayMCTS) or 'dict' (original MCTS)
+    mcts_batch_size = 8 # Leaves per NN call, collected with virtual loss (array backend)
+    tactics = True # Threat solver at MCTS expansion (False: immediate wins only)
+    vcf_max_nodes = 100 # Node budget of its VCF / VCT search per leaf
+    vct_depth = 0 # Open threes the VCT may play (0 = VCF only)
+    move_radius = 2 # MCTS only considers empty cells this close to a stone (0 = all)
+    model_arch = os.environ.get('MODEL_ARCH', 'conv') # 'conv' (GomokuNet) or 'resnet' (ResGomokuNet)
+    num_channels = int(os.environ.get('NUM_CHANNELS', 64))
+    num_res_blocks = int(os.environ.get('NUM_RES_BLOCKS', 6))
     if torch.cuda.is_available():
         device = 'cuda'
     elif torch.backends.mps.is_available():
@@ -47,23 +76,157 @@ class Args:
         device = 'cpu'
 
 args = Args()
-print(f"Server using device: {args.device}")
-nnet.to(args.device)
 
-mcts = MCTS(game, nnet, args)
+# INFERENCE_MODEL points at an artifact written by export.py (BatchNorm
+# folded, int8-quantized, TorchScript); it runs on the CPU. Otherwise the
+# eager checkpoint is loaded.
+INFERENCE_MODEL = os.environ.get('INFERENCE_MODEL')
+if INFERENCE_MODEL:
+    nnet = load_exported(INFERENCE_MODEL)
+    print(f"Exported model loaded from {INFERENCE_MODEL} ({nnet.config})")
+else:
+    nnet = make_model(game, args)
+
+    # Try load model
+    try:
+        nnet.load_checkpoint('checkpoint', 'best.pth.tar')
+        nnet.eval()
+        print("AI Model Loaded successfully")
+    except:
+        print("WARNING: No trained model found. AI will play randomly/poorly.")
+
+    print(f"Server using device: {args.device}")
+    nnet.to(args.device)
+
+# --- Concurrency ---
+# Searches run on a pool of SEARCH_WORKERS threads so the event loop (and
+# /health) never blocks. All their leaf evaluations go through one
+# InferenceBroker, which batches leaves across concurrent games. At most
+# MAX_PENDING searches may be running or queued; beyond that /predict
+# answers 503 instead of letting latency grow without bound.
+SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', 4))
+MAX_PENDING = int(os.environ.get('MAX_PENDING', 16))
+BROKER_MAX_BATCH_SIZE = 64
+BROKER_MAX_WAIT_MS = 1.0
+
+
+# Pondering: after answering a /predict call that has a sessionId, the
+# game's tree goes on searching the position the opponent now faces until
+# the game's next request arrives. That request stops it, finds the
+# opponent's actual move below the pondered root and counts the simulations
+# already there towards its budget. Background search runs on at most
+# PONDER_WORKERS threads (0 disables it), each ponder for at most
+# PONDER_SECONDS and PONDER_MAX_SIMS simulations.
+PONDER_WORKERS = int(os.environ.get('PONDER_WORKERS', 1))
+PONDER_SECONDS = float(os.environ.get('PONDER_SECONDS', 10.0))
+PONDER_MAX_SIMS = int(os.environ.get('PONDER_MAX_SIMS', 4 * args.numMCTSSims))
+
+broker = InferenceBroker(nnet, BOARD_SIZE, SEARCH_WORKERS + PONDER_WORKERS, max_leaves=args.mcts_batch_size,
+                         max_batch_size=BROKER_MAX_BATCH_SIZE, max_wait_ms=BROKER_MAX_WAIT_MS).start()
+evaluator = ThreadLocalEvaluator(broker)
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, initializer=evaluator.bind)
+ponder_pool = ThreadPoolExecutor(max_workers=PONDER_WORKERS, initializer=evaluator.bind) if PONDER_WORKERS > 0 else None
+pending_searches = 0
+# Set at shutdown: the stop event of every /predict and /analyze search
+stopping = threading.Event()
+
+# Search trees kept between /predict calls of the same game (see SearchSessions)
+MAX_SESSIONS = 64
+MAX_SESSION_MEMORY_MB = 256
+
+class Session:
+    # One game's search tree. `lock` keeps two searches (requests or
+    # pondering) off the tree at the same time; `move` counts the game's
+    # requests so a queued ponder can tell a newer request has overtaken it,
+    # and `ponder_stop` ends the ponder currently running.
+    def __init__(self):
+        self.tree = make_mcts(game, evaluator, args)
+        self.lock = threading.Lock()
+        self.move = 0
+        self.ponder_stop = threading.Event()
+
+    def interrupt(self):
+        # A new request of this game: any pondering on its tree is stale
+        self.move += 1
+        self.ponder_stop.set()
+
+class SearchSessions:
+    # LRU map of sessionId -> Session. The tree matches the incoming board
+    # against its stored root, so the next call of a game continues from the
+    # subtree of the moves played since, and starts fresh otherwise (new
+    # game, undo, ...). Least recently used trees are dropped once there are
+    # more than max_sessions or they take more than max_bytes in total.
+    def __init__(self, max_sessions, max_bytes):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.trees = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.trees.pop(session_id, None)
+            if session is None:
+                session = Session()
+            self.trees[session_id] = session
+            return session
+
+    def memory_bytes(self):
+        return sum(getattr(s.tree, 'memory_bytes', lambda: 0)() for s in list(self.trees.values()))
+
+    def trim(self):
+        # The most recent session is always kept
+        with self.lock:
+            while len(self.trees) > 1 and (len(self.trees) > self.max_sessions or self.memory_bytes() > self.max_bytes):
+                _, session = self.trees.popitem(last=False)
+                session.interrupt()
+
+    def stop_pondering(self):
+        with self.lock:
+            for session in self.trees.values():
+                session.interrupt()
+
+sessions = SearchSessions(MAX_SESSIONS, MAX_SESSION_MEMORY_MB * 1024 * 1024)
+
+# Finished searches shared by all requests, keyed by position under
+# symmetry: a position searched with at least numMCTSSims simulations is
+# answered from the cache without searching again. OPENING_BOOK points at a
+# SQLite book written by opening_book.py (looked up on memory misses).
+POSITION_CACHE_SIZE = int(os.environ.get('POSITION_CACHE_SIZE', 10000))
+OPENING_BOOK = os.environ.get('OPENING_BOOK')
+position_cache = PositionCache(game, POSITION_CACHE_SIZE, OPENING_BOOK)
+if OPENING_BOOK:
+    print(f"Opening book: {OPENING_BOOK}")
+
+# --- Profiling ---
+# PROFILE=1 turns on the timers and counters of profiling.py (MCTS phases,
+# tactics, NN evaluation); GET /metrics reports them together with the
+# cache, broker and session state, which are always available. A sampled
+# profile of all threads can be taken without a restart: POST
+# /profile?seconds=N returns it in the folded-stack format, and
+# kill -USR1 <pid> writes one to PROFILE_DIR.
+if os.environ.get('PROFILE', '0') == '1':
+    profiling.enable()
+    print("Profiling enabled")
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '.')
+MAX_PROFILE_SECONDS = 60.0
+profiling.install_signal_handler(PROFILE_DIR)
 
 class GameState(BaseModel):
     # Flattened grid or 2D grid
     grid: List[List[int]] 
-    # 1 for Player A (Black), -1 for Player B (White)
-    # Your React app uses 1 and 2 usually, we will map 2 -> -1
+    # 1 for Player A (Black), -1 for Player B (White); other values are rejected
     currentPlayer: int 
+    # Optional id of the game; consecutive calls with the same id reuse the search tree
+    sessionId: Optional[str] = None
+    # Optional thinking time in milliseconds. The search stops at this deadline
+    # (counted from when the request arrives) instead of after numMCTSSims.
+    time_ms: Optional[int] = None
 
 @app.post("/predict")
 async def predict_move(state: GameState):
     # Convert React grid (0, "A", "B") to Model grid (0, 1, -1)
     # Assuming React sends raw strings or mapped integers.
-    # Let's assume React sends: 0 for empty, 1 for Player A, -1 (or 2) for Player B.
+    # React sends: 0 for empty, 1 for Player A, -1 for Player B.
     
     board_np = np.array(state.grid)
     
@@ -72,24 +235,276 @@ async def predict_move(state: GameState):
         # Fallback: if we receive 15x15 but model is 8x8, we can just slice top-left 8x8 for testing
         # Or return error. For this toy example, let's return error.
         raise HTTPException(status_code=400, detail=f"Board must be {BOARD_SIZE}x{BOARD_SIZE}. AI is trained on {BOARD_SIZE}.")
+    # Anything else would index past the solver's pattern tables
+    if not np.isin(board_np, (-1, 0, 1)).all():
+        raise HTTPException(status_code=400, detail="Board cells must be 0, 1 or -1.")
+    if state.currentPlayer not in (1, -1):
+        raise HTTPException(status_code=400, detail="currentPlayer must be 1 or -1.")
+    board_np = board_np.astype(np.int8)
+
+    if state.time_ms is not None and state.time_ms <= 0:
+        raise HTTPException(status_code=400, detail="time_ms must be positive.")
+    received = time.monotonic()
 
     # Canonical form for the AI (AI always thinks it's Player 1)
     # The AI is 'state.currentPlayer'.
     canonical_board = game.get_canonical_form(board_np, state.currentPlayer)
-    
-    # Run MCTS
-    # We create a new MCTS instance or reset the tree ideally for stateless requests, 
-    # OR we keep the tree if we can track history. For simplicity: stateless.
-    mcts_search = MCTS(game, nnet, args)
-    
-    probs = mcts_search.getActionProb(canonical_board, temp=0) # temp=0 for max competitive play
-    action = np.argmax(probs)
-    
+
+    global pending_searches
+    if pending_searches >= MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly.", headers={"Retry-After": "1"})
+    pending_searches += 1
+    deadline = None if state.time_ms is None else received + state.time_ms / 1000.0
+    try:
+        loop = asyncio.get_running_loop()
+        action, simulations, cached = await loop.run_in_executor(search_pool, run_search, canonical_board, state.sessionId, deadline)
+    finally:
+        pending_searches -= 1
+
     row = int(action // BOARD_SIZE)
     col = int(action % BOARD_SIZE)
     
-    return {"row": row, "col": col}
+    return {"row": row, "col": col, "simulations": simulations, "cached": cached}
+
+def run_search(canonical_board, session_id, deadline=None):
+    # Runs on a search_pool thread. Returns (action, simulations, cached):
+    # simulations run, or behind the cached search when cached is True.
+    session = None if session_id is None else sessions.get(session_id)
+    if session is not None:
+        session.interrupt()
+
+    hit = position_cache.get(canonical_board, min_sims=args.numMCTSSims, accept_settled=True)
+    if hit is not None:
+        counts, _, sims = hit
+        action = np.argmax(counts)
+        if session is not None:
+            start_pondering(session, canonical_board, action)
+        return action, sims, True
+
+    max_sims = args.numMCTSSims if deadline is None else args.maxTimedSims
+
+    # Without a session the request is stateless and gets a fresh tree.
+    if session_id is None:
+        mcts_search = make_mcts(game, evaluator, args)
+        probs = mcts_search.getActionProb(canonical_board, temp=0, deadline=deadline, max_sims=max_sims, stop=stopping) # temp=0 for max competitive play
+        remember(canonical_board, mcts_search, max_sims, deadline is None)
+        return np.argmax(probs), mcts_search.sims_run, False
+
+    with session.lock:
+        probs = session.tree.getActionProb(canonical_board, temp=0, deadline=deadline, max_sims=max_sims, stop=stopping)
+        simulations = session.tree.sims_run
+        remember(canonical_board, session.tree, max_sims, deadline is None)
+    action = np.argmax(probs)
+    sessions.trim()
+    start_pondering(session, canonical_board, action)
+    return action, simulations, False
+
+def start_pondering(session, canonical_board, action):
+    if ponder_pool is None:
+        return
+    board, player, result = game.get_next_state_with_result(canonical_board, 1, int(action))
+    if result != 0:
+        return
+    stop = session.ponder_stop = threading.Event()
+    ponder_pool.submit(ponder, session, session.move, game.get_canonical_form(board, player), stop)
+
+def ponder(session, move, opponent_board, stop):
+    # Runs on a ponder_pool thread: searches the opponent's position in the
+    # game's tree until stopped, out of time or at PONDER_MAX_SIMS
+    with session.lock:
+        if session.move != move or stop.is_set():
+            return
+        deadline = time.monotonic() + PONDER_SECONDS
+        session.tree.getActionProb(opponent_board, temp=1, deadline=deadline, max_sims=PONDER_MAX_SIMS, stop=stop)
+
+def remember(canonical_board, mcts_search, max_sims, early_stop):
+    # Stores the root of a finished search in the position cache; the root
+    # has been visited once more than its edges. With early_stop (a temp=0
+    # search without a deadline) stopping before max_sims means the move was
+    # settled: stored with its real count and marked settled, so it answers
+    # later /predict requests but not /analyze, which needs the full counts.
+    counts, value = mcts_search.root_stats()
+    sims = int(counts.sum()) + 1
+    settled = early_stop and sims < max_sims
+    position_cache.put(canonical_board, counts, value, sims, settled=settled)
+
+# --- Batch analysis ---
+# POST /analyze scores many positions in one request: a list of boards, or a
+# game record (moves from the empty board) whose every position is scored.
+# 'search' runs a fresh MCTS per position (answered from the position cache
+# when it holds a search of at least that size); the searches run side by
+# side, so the broker batches their leaves together. 'fast' skips MCTS and
+# returns the network's masked policy and value, evaluated in chunks of
+# mcts_batch_size boards that the broker merges into larger batches.
+# Results are streamed as NDJSON, one line per position in the order they
+# finish (each carries its index). All analyses together use at most
+# ANALYZE_WORKERS threads of the search pool, so /predict keeps the rest.
+MAX_ANALYZE_POSITIONS = int(os.environ.get('MAX_ANALYZE_POSITIONS', 512))
+ANALYZE_WORKERS = int(os.environ.get('ANALYZE_WORKERS', max(1, SEARCH_WORKERS // 2)))
+analyze_slots = asyncio.Semaphore(ANALYZE_WORKERS)
+
+class Position(BaseModel):
+    grid: List[List[int]]
+    currentPlayer: int
+
+class AnalyzeRequest(BaseModel):
+    # Exactly one of positions / moves. moves: [row, col] pairs played
+    # alternately by 1 and -1 from the empty board; the position before
+    # every move and the one after the last are analyzed.
+    positions: Optional[List[Position]] = None
+    moves: Optional[List[List[int]]] = None
+    mode: str = 'search' # 'search' (MCTS) or 'fast' (network policy and value only)
+    top_k: int = 5
+    # Per position in 'search' mode: numMCTSSims by default, at least 2 (the
+    # first only expands the root) and at most maxTimedSims
+    simulations: Optional[int] = None
+
+def analysis_positions(request):
+    # [(board, player, played action or None)], validated
+    if (request.positions is None) == (request.moves is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of positions and moves.")
+    if request.positions is not None:
+        positions = []
+        for i, p in enumerate(request.positions):
+            board = np.array(p.grid)
+            if board.shape != (BOARD_SIZE, BOARD_SIZE):
+                raise HTTPException(status_code=400, detail=f"Position {i}: board must be {BOARD_SIZE}x{BOARD_SIZE}.")
+            if not np.isin(board, (-1, 0, 1)).all():
+                raise HTTPException(status_code=400, detail=f"Position {i}: board cells must be 0, 1 or -1.")
+            if p.currentPlayer not in (1, -1):
+                raise HTTPException(status_code=400, detail=f"Position {i}: currentPlayer must be 1 or -1.")
+            positions.append((board.astype(np.int8), p.currentPlayer, None))
+        return positions
+
+    board, player, positions = game.get_init_board(), 1, []
+    for i, move in enumerate(request.moves):
+        if len(move) != 2 or not all(0 <= x < BOARD_SIZE for x in move) or board[move[0], move[1]] != 0:
+            raise HTTPException(status_code=400, detail=f"Move {i} {move} is not an empty cell.")
+        action = move[0] * BOARD_SIZE + move[1]
+        positions.append((board, player, action))
+        board, player, result = game.get_next_state_with_result(board, player, action)
+        if result != 0 and i < len(request.moves) - 1:
+            raise HTTPException(status_code=400, detail=f"The game is over after move {i}.")
+    if not positions or result == 0:
+        positions.append((board, player, None))
+    return positions
+
+def cell(action):
+    return {"row": int(action // BOARD_SIZE), "col": int(action % BOARD_SIZE)}
+
+def analysis(index, player, played, policy, value, top_k, simulations=0, cached=False):
+    order = np.argsort(-policy, kind='stable')[:top_k]
+    result = {
+        "index": index,
+        "currentPlayer": player,
+        "move": cell(order[0]),
+        "value": float(value), # for currentPlayer, in [-1, 1]
+        "policy": [{**cell(a), "p": float(policy[a])} for a in order if policy[a] > 0],
+        "simulations": simulations,
+        "cached": cached,
+    }
+    if played is not None:
+        result["played"] = cell(played)
+        result["playedP"] = float(policy[played])
+    return result
+
+def analyze_fast(items, top_k):
+    # Runs on a search_pool thread: one network call for a chunk of
+    # (index, canonical board, player, played)
+    probs, values = evaluator.predict(np.stack([board for _, board, _, _ in items]))
+    results = []
+    for (index, board, player, played), p, v in zip(items, probs, values):
+        policy = p * (board.reshape(-1) == 0)
+        policy /= policy.sum()
+        results.append(analysis(index, player, played, policy, v, top_k))
+    return results
+
+def analyze_search(index, canonical_board, player, played, top_k, sims):
+    # Runs on a search_pool thread
+    hit = position_cache.get(canonical_board, min_sims=sims)
+    if hit is not None:
+        counts, value, cached_sims = hit
+        return [analysis(index, player, played, counts / counts.sum(), value, top_k, cached_sims, True)]
+    mcts_search = make_mcts(game, evaluator, args)
+    mcts_search.getActionProb(canonical_board, temp=1, max_sims=sims, stop=stopping)
+    remember(canonical_board, mcts_search, sims, False)
+    counts, value = mcts_search.root_stats()
+    return [analysis(index, player, played, counts / counts.sum(), value, top_k, mcts_search.sims_run)]
+
+@app.post("/analyze")
+async def analyze(request: AnalyzeRequest):
+    if request.mode not in ('search', 'fast'):
+        raise HTTPException(status_code=400, detail="mode must be 'search' or 'fast'.")
+    if not 1 <= request.top_k <= BOARD_SIZE * BOARD_SIZE:
+        raise HTTPException(status_code=400, detail=f"top_k must be in [1, {BOARD_SIZE * BOARD_SIZE}].")
+    sims = args.numMCTSSims if request.simulations is None else request.simulations
+    if not 2 <= sims <= args.maxTimedSims:
+        raise HTTPException(status_code=400, detail=f"simulations must be in [2, {args.maxTimedSims}].")
+    positions = analysis_positions(request)
+    if len(positions) > MAX_ANALYZE_POSITIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_ANALYZE_POSITIONS} positions per request.")
+
+    # Finished games are answered at once; the rest become pool jobs
+    finished, items = [], []
+    for index, (board, player, played) in enumerate(positions):
+        ended = game.get_game_ended(board, player)
+        if ended != 0:
+            finished.append({"index": index, "currentPlayer": player, "ended": float(ended)})
+        else:
+            items.append((index, game.get_canonical_form(board, player), player, played))
+    if request.mode == 'fast':
+        k = args.mcts_batch_size
+        jobs = [(analyze_fast, items[i:i + k], request.top_k) for i in range(0, len(items), k)]
+    else:
+        jobs = [(analyze_search, *item, request.top_k, sims) for item in items]
+
+    async def run(job):
+        async with analyze_slots:
+            return await asyncio.get_running_loop().run_in_executor(search_pool, *job)
+
+    async def stream():
+        for result in finished:
+            yield json.dumps(result) + '\n'
+        tasks = [asyncio.ensure_future(run(job)) for job in jobs]
+        try:
+            for task in asyncio.as_completed(tasks):
+                for result in await task:
+                    yield json.dumps(result) + '\n'
+        finally:
+            # Client gone: drop the jobs that have not started
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/metrics")
+def metrics():
+    lookups = position_cache.hits + position_cache.misses
+    return {
+        "profile": profiler.snapshot() if profiler.enabled else None,
+        "position_cache": {
+            "size": len(position_cache),
+            "hits": position_cache.hits,
+            "misses": position_cache.misses,
+            "hit_rate": position_cache.hits / lookups if lookups else 0.0,
+        },
+        "broker": broker.stats(),
+        "sessions": {
+            "count": len(sessions.trees),
+            "memory_mb": sessions.memory_bytes() / (1024 * 1024),
+        },
+        "pending_searches": pending_searches,
+    }
+
+@app.post("/profile")
+async def profile(seconds: float = 5.0):
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}].")
+    # Sampled on a thread of its own, so the search pool keeps its workers
+    loop = asyncio.get_running_loop()
+    samples = await loop.run_in_executor(None, profiling.sample_stacks, seconds)
+    return PlainTextResponse(profiling.format_folded(samples))
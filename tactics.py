@@ -0,0 +1,208 @@
+import functools
+import numpy as np
+
+from game import DIRECTIONS
+
+# --- Threat-space tactics ---
+# Pattern-based threat detection on 5- and 6-cell line windows, plus a
+# bounded VCF (victory by continuous fours) and an optional, conservative
+# VCT (victory by continuous threats: fours and open threes) search.
+#
+# Every line segment of 5 cells is a window. For a player p:
+#   - a window with 4 p stones and no opponent stone has one empty cell:
+#     playing it makes five (a winning square)
+#   - a window with 3 p stones and no opponent stone has two empty cells:
+#     playing either makes a four, threatening five on the other
+# A move that creates two or more distinct winning squares (open four,
+# double four) cannot be blocked. 6-cell windows with empty ends and
+# 2 p stones in the middle four cells give the moves that make an open
+# three (the middle empties).
+#
+# Boards are canonical: +1 is the player to move. The searches work on a
+# flat array of cell codes (empty 0, +1 stone 1, -1 stone 6) so that the sum
+# of a window's codes tells both stone counts at once; every scan is a few
+# vectorized gathers over all windows, and moves are made and unmade in place.
+
+WIN, LOSS, FORCED = 'win', 'loss', 'forced'
+
+_CODES = np.array([6, 0, 1], dtype=np.int16) # indexed by cell value + 1
+
+def _code(player):
+    return 1 if player == 1 else 6
+
+@functools.lru_cache(maxsize=None)
+def _windows(n, length):
+    # Flat cell indices of every `length`-cell line segment, all directions
+    windows = []
+    for dr, dc in DIRECTIONS:
+        for r in range(n):
+            for c in range(n):
+                er, ec = r + dr * (length - 1), c + dc * (length - 1)
+                if 0 <= er < n and 0 <= ec < n:
+                    windows.append([(r + dr * i) * n + c + dc * i for i in range(length)])
+    return np.array(windows, dtype=np.intp).reshape(-1, length)
+
+class TacticalSolver:
+    def __init__(self, game, vcf_max_nodes=100, vct_depth=0):
+        self.game = game
+        self.vcf_max_nodes = vcf_max_nodes
+        self.vct_depth = vct_depth
+        self.w5 = _windows(game.n, 5)
+        self.w6 = _windows(game.n, 6)
+        self.w5_columns = [np.ascontiguousarray(self.w5[:, i]) for i in range(5)]
+        self.nodes = 0
+
+    def encode(self, canonicalBoard):
+        return _CODES[canonicalBoard.reshape(-1).astype(np.intp) + 1]
+
+    # --- Threat detection ---
+
+    def window_sums(self, codes):
+        c = self.w5_columns
+        return codes[c[0]] + codes[c[1]] + codes[c[2]] + codes[c[3]] + codes[c[4]]
+
+    def winning_squares(self, codes, player, sums=None):
+        # Empty cells where `player` would make five
+        sums = self.window_sums(codes) if sums is None else sums
+        windows = self.w5[sums == 4 * _code(player)]
+        return np.unique(windows[codes[windows] == 0])
+
+    def four_moves(self, codes, player, sums=None):
+        # {move: set of winning squares it creates} for every move that makes a four
+        sums = self.window_sums(codes) if sums is None else sums
+        windows = self.w5[sums == 3 * _code(player)]
+        fours = {}
+        for a, b in windows[codes[windows] == 0].reshape(-1, 2).tolist():
+            fours.setdefault(a, set()).add(b)
+            fours.setdefault(b, set()).add(a)
+        return fours
+
+    def three_moves(self, codes, player):
+        # Moves that make an open three (a threat to make an open four next)
+        cells = codes[self.w6]
+        sel = (cells[:, 0] == 0) & (cells[:, 5] == 0) & (cells[:, 1:5].sum(1) == 2 * _code(player))
+        inner = self.w6[sel][:, 1:5]
+        return np.unique(inner[codes[inner] == 0])
+
+    # --- Searches ---
+
+    def vcf(self, codes, player):
+        # Winning line [move, forced reply, move, ...] for `player` (to move)
+        # made only of fours, or None. Bounded by vcf_max_nodes.
+        self.nodes = 0
+        return self._vcf(codes, player)
+
+    def _vcf(self, codes, player):
+        self.nodes += 1
+        sums = self.window_sums(codes)
+        wins = self.winning_squares(codes, player, sums)
+        if len(wins):
+            return [int(wins[0])]
+        if self.nodes > self.vcf_max_nodes:
+            return None
+        threats = self.winning_squares(codes, -player, sums)
+        if len(threats) > 1:
+            return None
+
+        fours = self.four_moves(codes, player, sums)
+        if len(threats):
+            # The opponent threatens five: only a block that is also a four keeps the initiative
+            block = int(threats[0])
+            fours = {block: fours[block]} if block in fours else {}
+
+        for a, squares in sorted(fours.items(), key=lambda item: -len(item[1])):
+            if len(squares) > 1:
+                return [a] # open or double four: only one of the squares can be blocked
+            (w,) = squares
+            codes[a], codes[w] = _code(player), _code(-player) # the reply is forced
+            line = self._vcf(codes, player)
+            codes[a], codes[w] = 0, 0
+            if line is not None:
+                return [a, w] + line
+        return None
+
+    def vct(self, codes, player, depth):
+        # Like vcf, but the attacker may also play open threes, up to `depth`
+        # of them. Conservative: a three only counts as winning if the
+        # attacker wins by VCF after every reply in the threat's zone (the
+        # cells around the three and the follow-up VCF), and no attempt is
+        # made while the defender has fours of its own.
+        self.nodes = 0
+        return self._vct(codes, player, depth)
+
+    def _vct(self, codes, player, depth):
+        line = self._vcf(codes, player)
+        if line is not None or depth == 0 or self.nodes > self.vcf_max_nodes:
+            return line
+        if len(self.winning_squares(codes, -player)) or self.four_moves(codes, -player):
+            return None
+
+        for a in self.three_moves(codes, player).tolist():
+            codes[a] = _code(player)
+            follow_up = self._vcf(codes, player) # what the three threatens if ignored
+            line = None
+            if follow_up is not None:
+                # Cells a reply could matter on: the follow-up itself, the lines
+                # through the three, and every window shared with a forced
+                # reply of the follow-up (a defender stone there could join
+                # those replies into a counter-four)
+                zone = set(follow_up)
+                for c in [a] + follow_up[1::2]:
+                    zone.update(self.w5[(self.w5 == c).any(1)].reshape(-1).tolist())
+                replies = [d for d in zone if codes[d] == 0]
+                if all(self._reply_loses(codes, player, d, depth) for d in replies):
+                    line = [a]
+            codes[a] = 0
+            if line is not None:
+                return line
+            if self.nodes > self.vcf_max_nodes:
+                break
+        return None
+
+    def _reply_loses(self, codes, player, d, depth):
+        codes[d] = _code(-player)
+        line = self._vct(codes, player, depth - 1)
+        codes[d] = 0
+        return line is not None
+
+    # --- MCTS interface ---
+
+    def analyze(self, canonicalBoard):
+        # Tactical status of a canonical board for the player to move:
+        #   (WIN, line)      it can force five; line[0] is the move to play
+        #   (LOSS, squares)  the opponent has two or more winning squares
+        #   (FORCED, [sq])   the opponent threatens five on sq: the only move
+        #   (None, None)     nothing forced
+        codes = self.encode(canonicalBoard)
+        sums = self.window_sums(codes)
+        wins = self.winning_squares(codes, 1, sums)
+        if len(wins):
+            return WIN, [int(wins[0])]
+        threats = self.winning_squares(codes, -1, sums)
+        if len(threats) > 1:
+            return LOSS, threats.tolist()
+
+        if self.vcf_max_nodes > 0:
+            line = self.vct(codes, 1, self.vct_depth) if self.vct_depth else self.vcf(codes, 1)
+            if line is not None:
+                return WIN, line
+        if len(threats):
+            return FORCED, threats.tolist()
+        return None, None
+
+class ImmediateWins:
+    # analyze() without threat search: only finds a move that wins at once
+    # (the tactical check MCTS had before the solver), for args.tactics=False
+    def __init__(self, game):
+        self.game = game
+
+    def analyze(self, canonicalBoard):
+        for a in np.flatnonzero(canonicalBoard.reshape(-1) == 0):
+            if self.game.is_winning_move(canonicalBoard, 1, a):
+                return WIN, [int(a)]
+        return None, None
+
+def make_solver(game, args):
+    if not getattr(args, 'tactics', True):
+        return ImmediateWins(game)
+    return TacticalSolver(game, getattr(args, 'vcf_max_nodes', 100), getattr(args, 'vct_depth', 0))
@@ -1,189 +1,259 @@
 from game import GomokuGame
-from model import GomokuNet
-from mcts import MCTS
+from model import make_model
+from mcts import make_mcts
+from selfplay import EvalCounter, execute_episode, parallel_self_play
+from replay import ReplayBuffer
+from export import inference_model
+from arena import EloLog, play_match
+from metrics import MetricsLog, last_record
+import profiling
+from profiling import profiler
 import numpy as np
 import torch
 import os
-import random
-from collections import deque
-import matplotlib.pyplot as plt
-import json
+import queue
+import subprocess
+import sys
+import threading
 import time
 from torch.utils.tensorboard import SummaryWriter
 
+def prefetch(iterable, depth=2):
+    # Iterates over `iterable` in a background thread, keeping up to `depth`
+    # items ready so producing the next item overlaps with consuming this one
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while (item := items.get()) is not done:
+        yield item
+    if errors:
+        raise errors[0]
+
 class Trainer:
     def __init__(self, game, nnet, args):
         self.game = game
         self.nnet = nnet
         self.args = args
-        self.mcts = MCTS(game, nnet, args)
+        self.mcts = make_mcts(game, nnet, args)
+        # Created once so Adam's moment estimates carry over between iterations
+        self.optimizer = torch.optim.Adam(self.nnet.parameters(), lr=self.args.lr)
+
+        # Arena gating: the weights of best.pth.tar and the Elo of every checkpoint
+        self.elo = EloLog(os.path.join(args.checkpoint, 'elo.json'))
+        self.best_state = None
+        if os.path.exists(os.path.join('checkpoint', 'best.pth.tar')):
+            self.best_state = torch.load(os.path.join('checkpoint', 'best.pth.tar'), map_location='cpu')['state_dict']
+
+        # Self-play examples of all iterations, persisted under the checkpoint folder
+        self.replay = ReplayBuffer(args.checkpoint, game.n, args.maxlenOfQueue)
         
         # TensorBoard Setup
         self.writer = SummaryWriter('runs/gomoku_experiment')
         
-        # Logging Setup
-        self.log_file = os.path.join(args.checkpoint, 'training_log.json')
-        self.log_data = {'history': []}
-        
-        # Load existing log if available
-        if os.path.exists(self.log_file):
-            try:
-                with open(self.log_file, 'r') as f:
-                    self.log_data = json.load(f)
-                print(f"Loaded training log with {len(self.log_data['history'])} entries.")
-            except Exception as e:
-                print(f"Error loading log file: {e}. Starting fresh log.")
-        
-        # Restore metrics history for plotting
-        if self.log_data['history']:
-            self.pi_loss_history = [x['pi_loss'] for x in self.log_data['history']]
-            self.v_loss_history = [x['v_loss'] for x in self.log_data['history']]
-        else:
-            self.pi_loss_history = []
-            self.v_loss_history = []
-
-    def execute_episode(self):
-        train_examples = []
-        board = self.game.get_init_board()
-        self.cur_player = 1
-        episode_step = 0
+        # Metrics: append-only JSON Lines (see metrics.py). A training_log.json
+        # written by older versions is migrated on the first start.
+        self.metrics_file = os.path.join(args.checkpoint, 'metrics.jsonl')
+        self.metrics = MetricsLog(self.metrics_file, os.path.join(args.checkpoint, 'training_log.json'))
+        self.plotter = None
 
-        # --- RANDOM START (Data Augmentation) ---
-        # To prevent the AI from overfitting to one opening and to help it handle
-        # disadvantages (like playing second against a center start), we randomize 
-        # the board state slightly at the beginning of 50% of games.
-        if random.random() < 0.5:
-            num_random_moves = random.randint(1, 2)
-            for _ in range(num_random_moves):
-                valid = self.game.get_valid_moves(board)
-                # Get indices of valid moves
-                valid_indices = np.where(valid == 1)[0]
-                if len(valid_indices) > 0:
-                    a = np.random.choice(valid_indices)
-                    board, self.cur_player = self.game.get_next_state(board, self.cur_player, a)
-                    episode_step += 1
-        # ---------------------------------------
+        # Opt-in timers and counters of the search (see profiling.py), summed
+        # over the trainer and its self-play workers and reported per
+        # iteration; kill -USR1 <pid> samples the trainer's stacks either way
+        if getattr(args, 'profile', False):
+            profiling.enable()
+        profiling.install_signal_handler(args.checkpoint)
 
-        while True:
-            episode_step += 1
-            canonical_board = self.game.get_canonical_form(board, self.cur_player)
-            temp = int(episode_step < self.args.tempThreshold)
-
-            pi = self.mcts.getActionProb(canonical_board, temp=temp)
-            sym = self.game.get_canonical_form(board, self.cur_player) 
-            
-            # Symmetries (optional but good for Board games)
-            # For brevity, skipping advanced symmetries, just storing raw
-            train_examples.append([sym, self.cur_player, pi, None])
-
-            action = np.random.choice(len(pi), p=pi)
-            board, self.cur_player = self.game.get_next_state(board, self.cur_player, action)
-
-            r = self.game.get_game_ended(board, self.cur_player)
-
-            if r != 0:
-                return [(x[0], x[2], r * ((-1) ** (x[1] != self.cur_player))) for x in train_examples]
+    def execute_episode(self, stats=None):
+        return execute_episode(self.game, self.mcts, self.args, stats)
 
     def train(self):
-        # Determine start iteration from logs
+        # Determine start iteration from the last logged epoch
         start_iter = 0
-        if self.log_data['history']:
-            start_iter = self.log_data['history'][-1]['iteration']
+        last = last_record(self.metrics_file, 'epoch')
+        if last is not None:
+            start_iter = last['iteration']
             print(f"Resuming from Iteration {start_iter + 1}")
 
         for i in range(start_iter, start_iter + self.args.numIters):
             self.current_iter = i + 1
             print(f'Starting Iteration {self.current_iter} ...')
-            iteration_train_examples = deque([], maxlen=self.args.maxlenOfQueue)
 
-            for eps in range(self.args.numEps):
-                print(f"Self-play Episode {eps+1}/{self.args.numEps}")
-                self.mcts = MCTS(self.game, self.nnet, self.args) # Reset search tree
-                iteration_train_examples += self.execute_episode()
+            profiler.reset() # The previous iteration's arena games are not self-play
+            start = time.perf_counter()
+            stats = {'sims': 0, 'evals': 0, 'examples': 0}
+            if self.args.num_workers > 1 or self.args.inference_broker:
+                episodes = parallel_self_play(self.game, self.nnet, self.args, self.args.numEps, iteration=i)
+                for eps, (examples, episode_stats) in enumerate(episodes):
+                    print(f"Self-play Episode {eps+1}/{self.args.numEps}")
+                    self.replay.add(examples, i)
+                    stats['examples'] += len(examples)
+                    stats['sims'] += episode_stats['sims']
+                    stats['evals'] += episode_stats['evals']
+                    if 'profile' in episode_stats:
+                        profiler.merge(episode_stats['profile'])
+            else:
+                player_net = EvalCounter(inference_model(self.nnet, self.game, self.args))
+                for eps in range(self.args.numEps):
+                    print(f"Self-play Episode {eps+1}/{self.args.numEps}")
+                    self.mcts = make_mcts(self.game, player_net, self.args) # Reset search tree
+                    examples = self.execute_episode(stats)
+                    self.replay.add(examples, i)
+                    stats['examples'] += len(examples)
+                stats['evals'] = player_net.evals
+            self.log_selfplay(stats, time.perf_counter() - start)
+            self.log_profile()
 
-            # Shuffle examples
-            train_data = list(iteration_train_examples)
-            random.shuffle(train_data)
-
-            self.train_neural_net(train_data)
+            # Train on the examples of the last replay_window iterations
+            self.train_neural_net(self.replay.recent(i, self.args.replay_window))
             self.nnet.save_checkpoint(folder='checkpoint', filename=f'checkpoint_{i}.pth.tar')
-            self.nnet.save_checkpoint(folder='checkpoint', filename='best.pth.tar')
+            self.gate(f'checkpoint_{i}.pth.tar', i)
+            self.save_plots()
+
+    def log_selfplay(self, stats, seconds):
+        # Self-play throughput of the current iteration
+        record = {
+            'kind': 'selfplay',
+            'iteration': self.current_iter,
+            'episodes': self.args.numEps,
+            **stats,
+            'seconds': seconds,
+            'sims_per_sec': stats['sims'] / seconds,
+            'evals_per_sec': stats['evals'] / seconds,
+            'examples_per_sec': stats['examples'] / seconds,
+            'timestamp': time.time()
+        }
+        self.metrics.append(record)
+        print(f"Self-play: {record['sims_per_sec']:.0f} sims/sec, {record['evals_per_sec']:.0f} NN evals/sec, "
+              f"{record['examples_per_sec']:.1f} examples/sec")
+        self.writer.add_scalar('SelfPlay/SimsPerSec', record['sims_per_sec'], self.current_iter)
+        self.writer.add_scalar('SelfPlay/EvalsPerSec', record['evals_per_sec'], self.current_iter)
+        self.writer.add_scalar('SelfPlay/ExamplesPerSec', record['examples_per_sec'], self.current_iter)
+
+    def log_profile(self):
+        # Self-play timers and counters of the current iteration
+        if not profiler.enabled:
+            return
+        print(profiler.format())
+        self.metrics.append({'kind': 'profile', 'iteration': self.current_iter, **profiler.snapshot(),
+                             'timestamp': time.time()})
+
+    def gate(self, candidate, iteration):
+        # Plays the freshly trained net against best.pth.tar and promotes it
+        # only if it wins at least updateThreshold of the decisive games.
+        # A rejected net is replaced by the best weights, so the next
+        # iteration does not train on from a regression.
+        # arenaCompare = 0 promotes every iteration without a match.
+        if self.args.arenaCompare <= 0 or self.best_state is None:
+            if self.best_state is None:
+                self.elo.record(candidate, None, 0, 0, 0, True, iteration + 1)
+            self.promote()
+            return
+
+        best = self.elo.data['best'] or 'best.pth.tar'
+        best_net = make_model(self.game, self.args)
+        best_net.load_state_dict(self.best_state)
+        best_net.to(self.args.device)
+
+        print(f"Arena: {candidate} vs {best} ({self.args.arenaCompare} games)")
+        wins, losses, draws = play_match(self.game, self.nnet, best_net, self.args, self.args.arenaCompare)
+        promoted = wins + losses > 0 and wins / (wins + losses) >= self.args.updateThreshold
+        elo = self.elo.record(candidate, best, wins, losses, draws, promoted, iteration + 1)
+        print(f"NEW/BEST WINS : {wins} / {losses} ; DRAWS : {draws} ; Elo {elo:.0f}")
+        self.writer.add_scalar('Arena/Elo', elo, iteration + 1)
+        self.writer.add_scalar('Arena/Score', (wins + 0.5 * draws) / self.args.arenaCompare, iteration + 1)
+
+        if promoted:
+            print("ACCEPTING NEW MODEL")
+            self.promote()
+        else:
+            print("REJECTING NEW MODEL")
+            self.nnet.load_state_dict(self.best_state)
+            # Adam's moments belong to the rejected weights
+            self.optimizer = torch.optim.Adam(self.nnet.parameters(), lr=self.args.lr)
+
+    def promote(self):
+        self.nnet.save_checkpoint(folder='checkpoint', filename='best.pth.tar')
+        self.best_state = {k: v.detach().cpu().clone() for k, v in self.nnet.state_dict().items()}
             
     def save_plots(self):
-        # Create a plot with 2 subplots
-        plt.figure(figsize=(12, 5))
-        
-        # Policy Loss
-        plt.subplot(1, 2, 1)
-        plt.plot(self.pi_loss_history, label='Policy Loss', color='blue')
-        plt.title('Policy Loss over Epochs')
-        plt.xlabel('Epochs')
-        plt.ylabel('Loss')
-        plt.legend()
-        plt.grid(True)
-        
-        # Value Loss
-        plt.subplot(1, 2, 2)
-        plt.plot(self.v_loss_history, label='Value Loss', color='red')
-        plt.title('Value Loss over Epochs')
-        plt.xlabel('Epochs')
-        plt.ylabel('Loss')
-        plt.legend()
-        plt.grid(True)
-        
-        plt.tight_layout()
-        
-        # Save to checkpoint folder
-        if not os.path.exists(self.args.checkpoint):
-            os.mkdir(self.args.checkpoint)
-        plt.savefig(os.path.join(self.args.checkpoint, 'training_metrics.png'))
-        plt.close()
+        # Renders training_metrics.png from the metrics file in a separate
+        # process, so plotting never holds up training; skipped while the
+        # previous plot is still being drawn
+        if not getattr(self.args, 'plot_metrics', True):
+            return
+        if self.plotter is not None and self.plotter.poll() is None:
+            return
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.py')
+        self.plotter = subprocess.Popen([sys.executable, script, '--checkpoint', self.args.checkpoint])
+
+    def train_neural_net(self, slots):
+        # slots: replay buffer slots to train on. They are gathered once into
+        # contiguous arrays; every epoch walks a fresh permutation of them in
+        # minibatches, built (and augmented) by a background thread one batch
+        # ahead of the training step.
+        boards, pis, vs = self.replay.gather(slots)
+        augment = getattr(self.args, 'augment_symmetries', True)
+        device = torch.device(self.args.device)
+        pin = device.type == 'cuda'
+        batch_size = self.args.batch_size
+        batch_count = int(len(slots) / batch_size)
 
-    def train_neural_net(self, examples):
-        optimizer = torch.optim.Adam(self.nnet.parameters(), lr=self.args.lr)
+        def batches():
+            order = np.random.permutation(len(slots))
+            for b in range(batch_count):
+                ids = order[b * batch_size:(b + 1) * batch_size]
+                batch = boards[ids], pis[ids], vs[ids]
+                if augment:
+                    # Lazy 8-fold augmentation: a random symmetry per drawn example
+                    batch = (*self.game.get_batch_symmetry(batch[0], batch[1], np.random.randint(8, size=batch_size)), batch[2])
+                batch = [torch.from_numpy(x) for x in batch]
+                yield [x.pin_memory() for x in batch] if pin else batch
 
         for epoch in range(self.args.epochs):
             print(f'Training Epoch {epoch+1}')
             self.nnet.train()
+            epoch_start = time.perf_counter()
             
-            batch_count = int(len(examples) / self.args.batch_size)
+            # Summed on the device; read back once per epoch instead of per step
+            epoch_pi_loss = torch.zeros((), device=device)
+            epoch_v_loss = torch.zeros((), device=device)
             
-            epoch_pi_loss = 0
-            epoch_v_loss = 0
-            
-            for _ in range(batch_count):
-                sample_ids = np.random.randint(len(examples), size=self.args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-                
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
-
-                # Move to device (CUDA / MPS / CPU)
-                boards = boards.contiguous().to(self.args.device)
-                target_pis = target_pis.contiguous().to(self.args.device)
-                target_vs = target_vs.contiguous().to(self.args.device)
+            for boards_b, pis_b, vs_b in prefetch(batches()):
+                # Move to device (CUDA / MPS / CPU); boards travel as int8
+                boards_b = boards_b.to(device, non_blocking=pin).float()
+                target_pis = pis_b.to(device, non_blocking=pin)
+                target_vs = vs_b.to(device, non_blocking=pin)
 
                 # compute output
-                out_pi, out_v = self.nnet(boards)
+                out_pi, out_v = self.nnet(boards_b)
                 l_pi = -torch.sum(target_pis * out_pi) / target_pis.size()[0]
                 l_v = torch.sum((target_vs - out_v.view(-1)) ** 2) / target_vs.size()[0]
                 total_loss = l_pi + l_v
                 
                 # Accumulate for average
-                epoch_pi_loss += l_pi.item()
-                epoch_v_loss += l_v.item()
+                epoch_pi_loss += l_pi.detach()
+                epoch_v_loss += l_v.detach()
 
-                optimizer.zero_grad()
+                self.optimizer.zero_grad()
                 total_loss.backward()
-                optimizer.step()
+                self.optimizer.step()
             
             # Avoid division by zero if batch_count is 0 (unlikely but safe)
             if batch_count > 0:
-                avg_pi = epoch_pi_loss / batch_count
-                avg_v = epoch_v_loss / batch_count
-                self.pi_loss_history.append(avg_pi)
-                self.v_loss_history.append(avg_v)
+                avg_pi = epoch_pi_loss.item() / batch_count
+                avg_v = epoch_v_loss.item() / batch_count
+                samples_per_sec = batch_count * batch_size / (time.perf_counter() - epoch_start)
                 print(f"Loss: {avg_pi + avg_v:.4f} (Pol: {avg_pi:.4f}, Val: {avg_v:.4f})")
                 
                 # TensorBoard logging
@@ -193,36 +263,48 @@ class Trainer:
                 self.writer.add_scalar('Loss/Total', avg_pi + avg_v, global_step)
                 self.writer.add_scalar('Loss/Policy', avg_pi, global_step)
                 self.writer.add_scalar('Loss/Value', avg_v, global_step)
+                self.writer.add_scalar('Train/SamplesPerSec', samples_per_sec, global_step)
 
-                # Log to JSON
-                log_entry = {
+                # One appended line per epoch (see metrics.py)
+                self.metrics.append({
+                    'kind': 'epoch',
                     'iteration': getattr(self, 'current_iter', 0),
                     'epoch': epoch + 1,
                     'pi_loss': float(avg_pi),
                     'v_loss': float(avg_v),
+                    'samples_per_sec': samples_per_sec,
                     'timestamp': time.time()
-                }
-                self.log_data['history'].append(log_entry)
-                
-                # Write to file (persistently)
-                try:
-                    with open(self.log_file, 'w') as f:
-                        json.dump(self.log_data, f, indent=4)
-                except Exception as e:
-                    print(f"Warning: Could not save log file: {e}")
-            
-            self.save_plots()
+                })
 
 class Args:
     def __init__(self):
         self.numIters = 100        # Train for longer (was 3)
         self.numEps = 50           # More games per batch (was 10)
         self.tempThreshold = 15
-        self.updateThreshold = 0.6
-        self.maxlenOfQueue = 200000
+        self.updateThreshold = 0.6 # New net replaces best.pth.tar if it wins this share of decisive arena games
+        self.maxlenOfQueue = 200000 # Replay buffer capacity (examples), kept in checkpoint/
+        self.replay_window = 20     # Train on the examples of this many most recent iterations
         self.numMCTSSims = 100     # Smarter self-play (was 25)
-        self.arenaCompare = 40
+        self.arenaCompare = 40     # Arena games new vs best per iteration (0 = always promote)
         self.cpuct = 1
+        self.mcts_backend = 'array' # 'array' (ArrayMCTS) or 'dict' (original MCTS)
+        self.mcts_batch_size = 8   # Leaves per NN call, collected with virtual loss (array backend)
+        self.num_workers = 1       # Self-play processes; >1 plays episodes in parallel on CPU
+        self.seed = None           # Base seed for the per-episode RNGs of self-play workers
+        self.inference_broker = False # Workers send leaves to one batched evaluator instead of owning a net
+        self.broker_max_batch_size = 64 # Evaluator runs once it has this many boards...
+        self.broker_max_wait_ms = 2.0   # ...or this long after the first request arrived
+        self.augment_symmetries = True # Train on a random rotation/reflection of each sampled example
+        self.symmetry_cache = False     # MCTS shares NN evaluations between symmetric positions
+        self.symmetry_cache_size = 100000 # Max positions in that cache (LRU)
+        self.tactics = True        # Threat solver at MCTS expansion (False: immediate wins only)
+        self.vcf_max_nodes = 100   # Node budget of its VCF / VCT search per leaf (0 = threats only)
+        self.vct_depth = 0         # Open threes the VCT may play (0 = VCF only)
+        self.move_radius = 2       # MCTS only considers empty cells this close to a stone (0 = all)
+        self.playout_cap_fraction = 1.0 # Share of self-play moves searched with numMCTSSims and recorded (1.0 = all)
+        self.fast_sims = 20        # Simulations of the other moves, which are played but not recorded
+        self.gumbel_root = False   # Self-play root search by Gumbel sampling + sequential halving (array backend)
+        self.gumbel_max_considered = 16 # Root moves sampled for sequential halving
         
         self.checkpoint = './checkpoint/'
         self.lr = 0.001
@@ -230,6 +312,12 @@ class Args:
         self.epochs = 5
         self.batch_size = 64
         self.num_channels = 64
+        self.model_arch = 'conv'   # 'conv' (GomokuNet, fixed board size) or 'resnet' (ResGomokuNet, any size)
+        self.num_res_blocks = 6    # Residual blocks of the 'resnet' tower
+        self.export_inference = False # Self-play searches with a BN-folded TorchScript export of the net (CPU)
+        self.quantize_inference = True # ...with its Linear layers dynamically quantized to int8
+        self.plot_metrics = True   # Redraw training_metrics.png in a background process every iteration
+        self.profile = False       # Time the search phases and NN calls, summarized per iteration
         
         # Device Selection
         if torch.cuda.is_available():
@@ -248,7 +336,7 @@ if __name__ == "__main__":
     # Change n=6 or n=8 to test the pipeline first.
     game = GomokuGame(n=8) 
     
-    nnet = GomokuNet(game)
+    nnet = make_model(game, args)
     nnet.to(args.device) # Move to GPU/MPS/CPU
     
     # Try loading checkpoint if exists